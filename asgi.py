@@ -0,0 +1,5 @@
+# ASGI entry point, e.g. `uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4`
+from server.asgi import create_asgi_app
+
+
+application = app = create_asgi_app()
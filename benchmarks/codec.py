@@ -0,0 +1,139 @@
+"""Cache codec cost for realistic search payloads: stdlib json vs. pre-rendered bodies.
+
+    python -m benchmarks.codec --items 12,48 [--redis-url redis://localhost:6379/15]
+
+"old" is what a cache hit used to cost: json.loads of the stored value and a
+json.dumps to send it. "new" is a msgpack envelope holding the already
+rendered (optionally gzip-compressed) response body, which a hit sends as-is.
+With ``--redis-url`` the stored size is measured with MEMORY USAGE.
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+
+import msgpack
+import orjson
+
+from server.seed import SYNTHETIC_BRANDS, SYNTHETIC_FILLER, synthetic_title
+
+
+def search_payload(items, seed=7):
+    rng = random.Random(seed)
+    data = []
+    for i in range(items):
+        title = synthetic_title(rng)
+        data.append({
+            'id': i + 1,
+            'title': title,
+            'description': f"{title}. " + ' '.join(rng.choices(SYNTHETIC_FILLER, k=60)),
+            'price': rng.randint(100, 500000) / 100.0,
+            'currency': 'INR',
+            'slug': f"{title.lower().replace(' ', '-')}-{i}",
+            'brand': {'id': rng.randint(1, 20), 'name': title.split()[0]},
+            'images': [{'src': f"/api/images/{i * 3 + n}", 'position': n} for n in range(3)],
+            'categories': [{'id': rng.randint(1, 200), 'name': 'Electronics'}],
+        })
+    return {
+        'total': 5000, 'page': 1, 'limit': items, 'next_cursor': 'eyJzIjoibmV3ZXN0In0', 'items': data,
+        'filters': {
+            'categories': [{'id': i, 'name': f"Category {i}", 'parent_id': None, 'count': 10} for i in range(40)],
+            'brands': [{'id': i, 'name': name, 'count': 10} for i, name in enumerate(SYNTHETIC_BRANDS)],
+        },
+    }
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def envelope(body):
+    return {'value': body, 'expires': time.time() + 3600, 'delta': 0.05}
+
+
+def variants(payload):
+    """(name, stored bytes, miss cost, hit cost) per codec."""
+    old_stored = json.dumps(payload).encode()
+    msgpack_stored = msgpack.packb(envelope(payload), use_bin_type=True)
+    raw_body = orjson.dumps(payload)
+
+    rows = [(
+        'old: json value',
+        old_stored,
+        lambda: json.dumps(payload).encode(),
+        lambda: json.dumps(json.loads(old_stored)).encode(),
+    ), (
+        'msgpack value',
+        msgpack_stored,
+        lambda: msgpack.packb(envelope(payload), use_bin_type=True),
+        lambda: orjson.dumps(msgpack.unpackb(msgpack_stored)['value']),
+    )]
+
+    for name, body in (('new: rendered body', raw_body), ('new: rendered gzip body', gzip.compress(raw_body, 6, mtime=0))):
+        stored = msgpack.packb(envelope(body), use_bin_type=True)
+        compress = name.endswith('gzip body')
+        rows.append((
+            name,
+            stored,
+            lambda compress=compress: msgpack.packb(envelope(
+                gzip.compress(orjson.dumps(payload), 6, mtime=0) if compress else orjson.dumps(payload)
+            ), use_bin_type=True),
+            lambda stored=stored: msgpack.unpackb(stored)['value'],
+        ))
+    return rows
+
+
+def redis_memory(client, key, value):
+    client.set(key, value)
+    try:
+        return client.memory_usage(key)
+    finally:
+        client.delete(key)
+
+
+def run(item_counts, repeat, redis_url=None):
+    client = None
+    if redis_url:
+        import redis
+        client = redis.from_url(redis_url)
+
+    results = []
+    for items in item_counts:
+        payload = search_payload(items)
+        for name, stored, miss, hit in variants(payload):
+            row = {
+                'items': items,
+                'codec': name,
+                'stored_bytes': len(stored),
+                'redis_bytes': redis_memory(client, 'bench:codec', stored) if client else None,
+                'miss_encode_us': round(timed(miss, repeat), 1),
+                'hit_us': round(timed(hit, repeat), 1),
+            }
+            results.append(row)
+            print(
+                f"{items:>3} items {name:<24} stored={row['stored_bytes']:>7}B "
+                f"redis={row['redis_bytes'] or '-':>7} miss={row['miss_encode_us']:>8.1f}us hit={row['hit_us']:>8.1f}us"
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', default='12,48')
+    parser.add_argument('--repeat', type=int, default=500)
+    parser.add_argument('--redis-url', default=None)
+    parser.add_argument('--output', help='write results as JSON to this path')
+    args = parser.parse_args()
+
+    results = run([int(i) for i in args.items.split(',')], args.repeat, args.redis_url)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import time
+
+import sqlalchemy as sa
+
+def create_bench_app(database_uri=None):
+    """Build an app bound to ``database_uri`` (a throwaway SQLite file by default) with Redis disabled.
+
+    The config classes read the environment at import time, so this must run
+    before anything else imports ``server``.
+    """
+    if database_uri is None:
+        database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='catalog-bench-'), 'catalog.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = database_uri
+    os.environ.setdefault('REDIS_URL', '')
+
+    from server import create_app
+    return create_app('testing')
+
+
+def load_synthetic_products(db, count, seed=42, chunk_size=10000):
+    """Insert ``count`` products of the seeder's synthetic source with executemany, returning the elapsed seconds.
+
+    Faster than the seeder itself for large catalogs: no categories, images or
+    slug lookups.
+    """
+    from server.models import Brand, Product
+    from server.seed import SYNTHETIC_BRANDS, synthetic_products
+
+    started = time.perf_counter()
+
+    brand_ids = {}
+    for name in SYNTHETIC_BRANDS:
+        brand = Brand.query.filter_by(name=name).first() or Brand(name=name)
+        db.session.add(brand)
+        db.session.flush()
+        brand_ids[name] = brand.id
+    db.session.commit()
+
+    offset = db.session.scalar(sa.select(sa.func.count(Product.id)))
+    products = synthetic_products(count, seed=seed)
+    for start in range(0, count, chunk_size):
+        rows = []
+        for i, (job, _, _) in zip(range(start, min(start + chunk_size, count)), products):
+            rows.append({
+                'title': job['name'],
+                'description': job['description'],
+                'price': round(job['price'] * 100),
+                'currency': 'INR',
+                'slug': f"bench-{offset + i}",
+                'brand_id': brand_ids[job['name'].split()[0]],
+            })
+        db.session.execute(sa.insert(Product), rows)
+        db.session.commit()
+
+    return time.perf_counter() - started
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
@@ -0,0 +1,116 @@
+"""Query plans of every search filter and sort combination.
+
+    python -m benchmarks.explain --size 20000
+
+Prints the plan of the page query for each combination and exits non-zero
+when one reads the whole products table (a SQLite ``SCAN products`` or a
+Postgres ``Seq Scan on products``), or sorts rows (``USE TEMP B-TREE FOR
+ORDER BY``, a Postgres ``Sort``) where an index delivers them in order.
+
+Only unfiltered, brand and price-range searches sorted by a column of their
+index can be read in order. The others, text search, categories (the filter
+is on product_category, the sort keys on products) and price ranges sorted by
+newest, sort the rows that match, never the whole table. The catalog
+comes from the seeder's synthetic source, so categories are populated. Pass
+``--database-uri`` to check Postgres, whose plans depend on the statistics
+refreshed by ``ANALYZE`` here.
+"""
+import argparse
+import itertools
+import re
+import sys
+
+import sqlalchemy as sa
+
+from .common import create_bench_app
+
+FILTERS = ('q', 'category', 'brand', 'price range')
+SORTS = ('newest', 'price', '-price', 'relevance')
+FULL_SCAN = re.compile(r'SCAN products(?! USING)(?!_fts)|Seq Scan on products\b')
+SORT = re.compile(r'USE TEMP B-TREE FOR ORDER BY|^\s*(->\s*)?(Incremental )?Sort\b')
+
+
+def index_ordered(filters, sort):
+    """Whether an index can return the rows of this combination in sort order."""
+    if set(filters) <= {'brand'}:
+        return sort != 'relevance'
+    return set(filters) <= {'brand', 'price range'} and sort in ('price', '-price')
+
+
+def filter_combinations():
+    for size in range(len(FILTERS) + 1):
+        yield from itertools.combinations(FILTERS, size)
+
+
+def explain(statement):
+    from server import db
+
+    engine = db.engine
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.execute(sa.text(prefix + sql)).all()
+    # SQLite rows are (id, parent, notused, detail), Postgres rows a single text column
+    return [row[-1] for row in rows]
+
+
+def run(size, database_uri=None):
+    app = create_bench_app(database_uri)
+
+    from flask_migrate import upgrade
+    from server import db
+    from server.blueprints.products import search_rows
+    from server.models import Brand, Category, Product
+    from server.seed import seed
+
+    counts = {'ordered': 0, 'sorted': 0, 'failed': 0}
+    with app.app_context():
+        upgrade()
+        existing = db.session.scalar(sa.select(sa.func.count(Product.id)))
+        if existing < size:
+            seed(source='synthetic', count=size - existing, variant_workers=0)
+        db.session.execute(sa.text('ANALYZE'))
+        db.session.commit()
+
+        category_id = db.session.scalar(sa.select(Category.id).where(Category.parent_id.is_(None)).limit(1))
+        brand_id = db.session.scalar(sa.select(Brand.id).limit(1))
+        values = {
+            'q': {'q': 'wireless'},
+            'category': {'category_id': category_id},
+            'brand': {'brand_id': brand_id},
+            'price range': {'min_price': 100000, 'max_price': 250000},
+        }
+
+        for filters, sort in itertools.product(filter_combinations(), SORTS):
+            if sort == 'relevance' and 'q' not in filters:
+                continue
+            params = {k: v for name in filters for k, v in values[name].items()}
+            _, items, _ = search_rows(sort=sort, **params)
+            plan = explain(items.statement)
+            if any(FULL_SCAN.search(line) for line in plan):
+                status = 'FULL SCAN'
+            elif any(SORT.search(line) for line in plan):
+                status = 'SORT' if index_ordered(filters, sort) else 'sorted'
+            else:
+                status = 'ordered'
+            counts[status if status in counts else 'failed'] += 1
+            label = ' + '.join(filters) or 'no filter'
+            print(f"{status:<9} {label} / sort={sort}")
+            for line in plan:
+                print(f"          {line}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--database-uri', default=None)
+    args = parser.parse_args()
+
+    counts = run(args.size, args.database_uri)
+    print(f"{counts['ordered']} combination(s) read rows in index order, {counts['sorted']} sort their "
+          f"matches, {counts['failed']} scan the whole table or sort despite an index")
+    sys.exit(1 if counts['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""Load test of the catalog API against a generated catalog, reported as JSON.
+
+    python -m benchmarks.load --size 100000 --requests 2000 --threads 8 --output run.json
+    python -m benchmarks.load --size 100000 --compare before.json after.json
+
+The catalog comes from the seeder's synthetic source (brands, a two-level
+category tree and an image per product) and is reused when the database
+already holds ``--size`` products. Requests go through the WSGI app in-process
+from ``--threads`` concurrent clients:
+
+- ``search``: a mix of text queries, category/brand filters, price sorts and pages
+- ``detail``: product pages by slug
+- ``create``: ``POST /api/products`` with an image
+
+Read scenarios run ``cold`` (cache disabled, every request hits the database)
+and ``warm`` (the same requests again after one priming pass), using the
+in-process cache plus fakeredis with ``--redis fake``.
+"""
+import argparse
+import base64
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+
+from .common import create_bench_app, summarize
+
+SEARCH_PAGES = (1, 1, 1, 1, 2, 2, 3, 5)
+SORTS = (None, None, 'price', '-price')
+
+
+def ensure_catalog(size, variant_workers):
+    from server import db
+    from server.models import Product
+    from server.seed import seed
+
+    existing = db.session.scalar(db.select(db.func.count(Product.id)))
+    if existing < size:
+        seed(source='synthetic', count=size - existing, variant_workers=variant_workers)
+    return db.session.scalar(db.select(db.func.count(Product.id)))
+
+
+def search_urls(count, rng):
+    from server import db
+    from server.models import Brand, Category
+    from server.seed import SYNTHETIC_ADJECTIVES, SYNTHETIC_NOUNS
+
+    category_ids = db.session.scalars(db.select(Category.id)).all()
+    brand_ids = db.session.scalars(db.select(Brand.id)).all()
+    words = SYNTHETIC_ADJECTIVES + SYNTHETIC_NOUNS
+
+    urls = []
+    for _ in range(count):
+        params = {'limit': 12, 'page': rng.choice(SEARCH_PAGES)}
+        if rng.random() < 0.7:
+            params['q'] = ' '.join(rng.sample(words, rng.choice((1, 1, 2))))
+        if rng.random() < 0.3:
+            params['category_id'] = rng.choice(category_ids)
+        if rng.random() < 0.2:
+            params['brand_id'] = rng.choice(brand_ids)
+        sort = rng.choice(SORTS)
+        if sort:
+            params['sort'] = sort
+        urls.append('/api/products/search?' + '&'.join(f"{k}={v}" for k, v in params.items()))
+    return urls
+
+
+def detail_urls(count, rng):
+    from server import db
+    from server.models import Product
+
+    # A popular subset, so a warm cache sees repeats like real traffic
+    slugs = db.session.scalars(db.select(Product.slug).order_by(db.func.random()).limit(500)).all()
+    return [f"/api/products/{rng.choice(slugs)}" for _ in range(count)]
+
+
+def create_bodies(count, rng):
+    from server import db
+    from server.models import Brand, Category
+    from server.seed import SYNTHETIC_ADJECTIVES, SYNTHETIC_NOUNS, synthetic_image
+
+    category_ids = db.session.scalars(db.select(Category.id)).all()
+    brand_ids = db.session.scalars(db.select(Brand.id)).all()
+    image = base64.b64encode(synthetic_image(0)).decode()
+    return [
+        {
+            'title': f"Load test {rng.choice(SYNTHETIC_ADJECTIVES)} {rng.choice(SYNTHETIC_NOUNS)}",
+            'description': 'Created by benchmarks.load',
+            'price': rng.randint(100, 500000) / 100.0,
+            'brand_id': rng.choice(brand_ids),
+            'category_ids': rng.sample(category_ids, 2),
+            'images': [{'data': image, 'mime_type': 'image/png'}],
+        }
+        for _ in range(count)
+    ]
+
+
+def drive(app, requests, threads):
+    """Send ``requests`` ((method, url, body) tuples) from ``threads`` clients."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(chunk):
+        test_client = app.test_client()
+        local, failed = [], 0
+        for method, url, body in chunk:
+            started = time.perf_counter()
+            try:
+                failed += test_client.open(url, method=method, json=body).status_code >= 400
+            except Exception:
+                failed += 1
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    workers = [threading.Thread(target=client, args=(requests[i::threads],)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        **summarize(latencies),
+        'errors': sum(errors),
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+    }
+
+
+def run(size, request_count, threads, redis, database_uri=None, seed=1, variant_workers=0):
+    app = create_bench_app(database_uri)
+    from server.cache import Cache
+
+    if redis == 'fake':
+        import fakeredis
+        app.cache.client = fakeredis.FakeStrictRedis()
+    warm_cache = app.cache
+
+    rng = random.Random(seed)
+    results = []
+    with app.app_context():
+        from flask_migrate import upgrade
+        upgrade()
+        started = time.perf_counter()
+        products = ensure_catalog(size, variant_workers)
+        print(f"catalog: {products} products ready in {time.perf_counter() - started:.1f}s")
+
+        scenarios = {
+            'search': [('GET', url, None) for url in search_urls(request_count, rng)],
+            'detail': [('GET', url, None) for url in detail_urls(request_count, rng)],
+        }
+        writes = [('POST', '/api/products', body) for body in create_bodies(max(request_count // 10, 1), rng)]
+
+    def record(scenario, cache, stats):
+        results.append({'scenario': scenario, 'cache': cache, **stats})
+        print(
+            f"{scenario:<7} {cache:<5} {stats['count']:>6} req {stats['throughput_rps']:>8.1f} req/s "
+            f"p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms "
+            f"errors={stats['errors']}"
+        )
+
+    # No cache at all; without Redis, stampede protection would only make
+    # concurrent duplicates wait for each other
+    cold_cache = Cache()
+    cold_cache.stampede_protection = False
+
+    for name, requests in scenarios.items():
+        app.cache = cold_cache
+        record(name, 'cold', drive(app, requests, threads))
+
+        app.cache = warm_cache
+        drive(app, requests, threads)
+        record(name, 'warm', drive(app, requests, threads))
+
+    # SQLite allows one writer at a time, concurrent inserts would just fail
+    writers = 1 if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite') else threads
+    record('create', 'warm', drive(app, writes, writers))
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+            'redis': redis,
+            'products': products,
+            'requests': request_count,
+            'threads': threads,
+        },
+        'results': results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    baseline = {(r['scenario'], r['cache']): r for r in before['results']}
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']}")
+    for row in after['results']:
+        old = baseline.get((row['scenario'], row['cache']))
+        if old is None:
+            continue
+        changes = ' '.join(
+            f"{metric}={old[metric]:g}->{row[metric]:g} ({(row[metric] - old[metric]) / old[metric] * 100:+.0f}%)"
+            for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms') if old[metric]
+        )
+        print(f"{row['scenario']:<7} {row['cache']:<5} {changes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=10000, help='products in the catalog')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per read scenario')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--redis', choices=('none', 'fake'), default='none',
+                        help='L2 for the warm runs; fake needs benchmarks/requirements.txt')
+    parser.add_argument('--database-uri', help='defaults to a throwaway SQLite file')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the request mix')
+    parser.add_argument('--variant-workers', type=int, default=0, help='render image thumbnails while seeding')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args.size, args.requests, args.threads, args.redis, args.database_uri, args.seed, args.variant_workers)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
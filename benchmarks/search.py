@@ -0,0 +1,97 @@
+"""Search latency: full-text index vs. the old ``title ilike '%q%'`` scan.
+
+    python -m benchmarks.search --sizes 10000,100000,1000000
+
+The catalog grows in place between sizes, so each size reuses the rows of the
+previous one. Pass ``--database-uri`` to run against Postgres instead of a
+throwaway SQLite file; the schema is created with the real migrations.
+"""
+import argparse
+import json
+import time
+
+from .common import create_bench_app, load_synthetic_products, summarize
+
+QUERIES = [
+    'phone',               # common single token
+    'wireless headphones', # two common tokens
+    'sams',                # prefix of a brand
+    'apple smart watch',   # three tokens
+    'warranty',            # only in descriptions
+    'trimmer 42',          # rare combination
+]
+PAGE_SIZE = 12
+
+
+def ilike_page(q):
+    from server.models import Product
+
+    query = Product.query.filter(Product.title.ilike(f"%{q}%"))
+    total = query.count()
+    ids = [p.id for p in query.limit(PAGE_SIZE).all()]
+    return total, ids
+
+
+def fulltext_page(q):
+    from server.models import Product
+    from server.search import apply_text_search
+
+    query, rank = apply_text_search(Product.query, q)
+    total = query.count()
+    if rank is not None:
+        query = query.order_by(rank, Product.id)
+    ids = [p.id for p in query.limit(PAGE_SIZE).all()]
+    return total, ids
+
+
+def run(sizes, repeat, database_uri=None):
+    app = create_bench_app(database_uri)
+
+    from flask_migrate import upgrade
+    from server import db
+    from server.search import fulltext_available
+
+    results = []
+    with app.app_context():
+        upgrade()
+        print(f"full-text index available: {fulltext_available()}")
+
+        loaded = 0
+        for size in sizes:
+            elapsed = load_synthetic_products(db, size - loaded, seed=size)
+            print(f"loaded {size - loaded} products in {elapsed:.1f}s")
+            loaded = size
+
+            for name, fn in (('ilike', ilike_page), ('fulltext', fulltext_page)):
+                samples = []
+                for _ in range(repeat):
+                    for q in QUERIES:
+                        started = time.perf_counter()
+                        fn(q)
+                        samples.append(time.perf_counter() - started)
+                        db.session.rollback()
+                row = {'size': size, 'path': name, **summarize(samples)}
+                results.append(row)
+                print(f"{size:>9} {name:<9} p50={row['p50_ms']:>9.2f}ms p99={row['p99_ms']:>9.2f}ms")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--output', help='write results as JSON to this path')
+    args = parser.parse_args()
+
+    sizes = sorted(int(s) for s in args.sizes.split(','))
+    results = run(sizes, args.repeat, args.database_uri)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Requests/sec of one worker process under the sync, gthread and ASGI setups.
+
+    python -m benchmarks.serving --size 10000 --clients 32 --query-delay-ms 2
+
+Each server runs as a real process (gunicorn or uvicorn) against the same
+generated SQLite catalog with caching disabled, so every request reaches the
+database, and is driven over HTTP by ``--clients`` concurrent clients.
+SQLite answers in-process in microseconds, which hides exactly the waiting
+that threads overlap; ``--query-delay-ms`` adds a sleep per SQL statement to
+model the round-trip to a networked Postgres (pass ``--database-uri`` to use
+a real one instead).
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from .common import create_bench_app, summarize
+
+# --threads 1 for sync: gunicorn.conf.py sets 8, which silently upgrades sync to gthread
+SERVERS = {
+    'sync': ['gunicorn', '-k', 'sync', '-w', '1', '--threads', '1'],
+    'gthread': ['gunicorn', '-k', 'gthread', '-w', '1', '--threads', '{threads}'],
+    'asgi': ['uvicorn', '--workers', '1', '--factory'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, port, threads, env):
+    if kind == 'asgi':
+        command = SERVERS[kind] + ['--port', str(port), '--log-level', 'warning', 'benchmarks.serving_app:create_asgi']
+        env = {**env, 'ASGI_THREADS': str(threads)}
+    else:
+        command = [arg.format(threads=threads) for arg in SERVERS[kind]]
+        command += ['-b', f'127.0.0.1:{port}', '--access-logfile', os.devnull, '--log-level', 'warning',
+                    'benchmarks.serving_app:app']
+    process = subprocess.Popen(command, env=env)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{kind} server did not start')
+
+
+def drive(base_url, urls, clients):
+    import requests
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def client(chunk):
+        session = requests.Session()
+        local, failed = [], 0
+        for url in chunk:
+            started = time.perf_counter()
+            try:
+                failed += session.get(base_url + url, timeout=30).status_code >= 400
+            except requests.RequestException:
+                failed += 1
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    workers = [threading.Thread(target=client, args=(urls[i::clients],)) for i in range(clients)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    return {
+        **summarize(latencies),
+        'errors': sum(errors),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+    }
+
+
+def run(kinds, size, request_count, clients, threads, query_delay_ms, database_uri=None, seed=1):
+    from .load import detail_urls, ensure_catalog, search_urls
+
+    app = create_bench_app(database_uri)
+    rng = random.Random(seed)
+    with app.app_context():
+        from flask_migrate import upgrade
+        upgrade()
+        ensure_catalog(size, variant_workers=0)
+        urls = search_urls(request_count // 2, rng) + detail_urls(request_count - request_count // 2, rng)
+    rng.shuffle(urls)
+
+    env = {
+        **os.environ,
+        'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI'],
+        'REDIS_URL': '',
+        'CACHE_L1_SIZE': '0',
+        # Without Redis the stampede lock only makes duplicate requests wait on each other
+        'CACHE_STAMPEDE_PROTECTION': '0',
+        'BENCH_QUERY_DELAY_MS': str(query_delay_ms),
+        'PYTHONPATH': os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])),
+    }
+
+    results = []
+    for kind in kinds:
+        port = free_port()
+        process = start_server(kind, port, threads, env)
+        try:
+            base_url = f'http://127.0.0.1:{port}'
+            drive(base_url, urls[:max(clients, len(urls) // 10)], clients)  # warm up connections and imports
+            stats = drive(base_url, urls, clients)
+        finally:
+            process.terminate()
+            process.wait()
+        results.append({'server': kind, 'threads': 1 if kind == 'sync' else threads, **stats})
+        print(f"{kind:<8} {stats['throughput_rps']:>8.1f} req/s p50={stats['p50_ms']:.1f}ms "
+              f"p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms errors={stats['errors']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', default='sync,gthread,asgi')
+    parser.add_argument('--size', type=int, default=10000, help='products in the catalog')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=32, help='concurrent HTTP clients')
+    parser.add_argument('--threads', type=int, default=8, help='threads per worker for gthread and asgi')
+    parser.add_argument('--query-delay-ms', type=float, default=2.0, help='simulated database round-trip')
+    parser.add_argument('--database-uri', help='defaults to a throwaway SQLite file')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    args = parser.parse_args()
+
+    results = run(args.servers.split(','), args.size, args.requests, args.clients, args.threads,
+                  args.query_delay_ms, args.database_uri)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
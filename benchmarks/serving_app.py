@@ -0,0 +1,25 @@
+"""The app served by benchmarks.serving, with an optional per-statement delay.
+
+BENCH_QUERY_DELAY_MS sleeps before every SQL statement, standing in for the
+network round-trip to a database server. The sleep releases the GIL just like
+a driver waiting on a socket does.
+"""
+import os
+import time
+
+import sqlalchemy as sa
+
+from server import create_app
+
+app = create_app('testing')
+
+_delay = float(os.environ.get('BENCH_QUERY_DELAY_MS', '0')) / 1000.0
+if _delay:
+    @sa.event.listens_for(sa.engine.Engine, 'before_cursor_execute')
+    def _network_round_trip(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(_delay)
+
+
+def create_asgi():
+    from server.asgi import create_asgi_app
+    return create_asgi_app(app)
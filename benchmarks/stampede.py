@@ -0,0 +1,153 @@
+"""Database load when a hot cache key expires under concurrent traffic.
+
+    python -m benchmarks.stampede --workers 4 --threads 16
+
+Simulates ``--workers`` gunicorn workers (separate apps, each with its own
+in-process cache) sharing one Redis (fakeredis) and one database, with
+``--threads`` concurrent clients per worker. For each expiry scenario it
+counts the SQL statements issued during the burst with stampede protection
+on and off.
+"""
+import argparse
+import json
+import threading
+import time
+from contextlib import ExitStack
+
+from .common import create_bench_app, load_synthetic_products, summarize
+
+HOT_URL = '/api/products/search?q=phone&limit=12'
+
+
+def make_workers(count, redis_server, database_uri):
+    import fakeredis
+
+    apps = []
+    for _ in range(count):
+        app = create_bench_app(database_uri)
+        app.cache.client = fakeredis.FakeStrictRedis(server=redis_server)
+        apps.append(app)
+    return apps
+
+
+def expire(apps, scenario):
+    """Make the hot search key (and its facets) miss or go stale everywhere."""
+    from server.cache import decode, encode
+
+    cache = apps[0].cache
+    keys = [k.decode() for k in cache.client.keys('search:*') + cache.client.keys('filters:*')]
+    for app in apps:
+        if app.cache.local is not None:
+            app.cache.local.clear()
+
+    for key in keys:
+        if scenario == 'hard':
+            cache.client.delete(key)
+        else:
+            entry = decode(cache.client.get(key))
+            entry['expires'] = time.time() - 1
+            cache.client.set(key, encode(entry))
+
+
+def burst(apps, threads, requests_per_thread):
+    from server import db
+    from server.testing import count_queries
+
+    latencies = []
+    barrier = threading.Barrier(len(apps) * threads)
+
+    def client(app):
+        test_client = app.test_client()
+        barrier.wait()
+        for _ in range(requests_per_thread):
+            started = time.perf_counter()
+            response = test_client.get(HOT_URL)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200
+
+    engines = []
+    for app in apps:
+        with app.app_context():
+            engines.append(db.engine)
+
+    workers = [threading.Thread(target=client, args=(app,)) for app in apps for _ in range(threads)]
+    with ExitStack() as stack:
+        statements = [stack.enter_context(count_queries(engine)) for engine in engines]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        # Let background refreshes finish before counting
+        time.sleep(0.5)
+
+    return sum(len(s) for s in statements), latencies
+
+
+def run(workers, threads, requests_per_thread, size):
+    import fakeredis
+
+    redis_server = fakeredis.FakeServer()
+    seed_app = create_bench_app()
+    database_uri = seed_app.config['SQLALCHEMY_DATABASE_URI']
+
+    from flask_migrate import upgrade
+    from server import db
+
+    with seed_app.app_context():
+        upgrade()
+        load_synthetic_products(db, size)
+
+    apps = make_workers(workers, redis_server, database_uri)
+    cold = apps[0].test_client()
+
+    results = []
+    for protection in (False, True):
+        for app in apps:
+            app.cache.stampede_protection = protection
+        for scenario in ('hard', 'stale'):
+            fakeredis.FakeStrictRedis(server=redis_server).flushall()
+            for app in apps:
+                if app.cache.local is not None:
+                    app.cache.local.clear()
+            # Populate the key once, then expire it under load
+            assert cold.get(HOT_URL).status_code == 200
+            if scenario == 'stale' and not protection:
+                # Plain entries have no soft expiry, a stale key is a miss
+                expire(apps, 'hard')
+            else:
+                expire(apps, scenario)
+
+            queries, latencies = burst(apps, threads, requests_per_thread)
+            row = {
+                'protection': protection,
+                'scenario': scenario,
+                'clients': workers * threads,
+                'requests': len(latencies),
+                'queries': queries,
+                **summarize(latencies),
+            }
+            results.append(row)
+            print(
+                f"protection={'on ' if protection else 'off'} {scenario:<5} clients={row['clients']:<4} "
+                f"queries={queries:<5} p50={row['p50_ms']:.1f}ms p99={row['p99_ms']:.1f}ms"
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=5, help='requests per client thread')
+    parser.add_argument('--size', type=int, default=20000, help='products in the catalog')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    args = parser.parse_args()
+
+    results = run(args.workers, args.threads, args.requests, args.size)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
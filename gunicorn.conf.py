@@ -0,0 +1,43 @@
+# Picked up automatically by gunicorn when started from the project root.
+#
+# Requests spend most of their time waiting on Postgres and Redis, and both
+# drivers release the GIL while they wait, so each worker runs a pool of
+# threads (gthread) to overlap that I/O instead of serving one request at a
+# time. Keep GUNICORN_THREADS at or below the database pool size
+# (DB_POOL_SIZE plus DB_MAX_OVERFLOW, 5 + 10 by default) or threads will
+# queue for a connection. Command line flags override these settings.
+import glob
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+keepalive = 5
+timeout = 30
+accesslog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # Prometheus multiprocess mode keeps one file per worker; start clean
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+
+def when_ready(server):
+    # Fill the shared cache while workers start taking traffic, see server/warmup.py
+    if os.environ.get('CACHE_WARM_ON_START') == '1':
+        subprocess.Popen([sys.executable, '-m', 'flask', 'cache', 'warm'])
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
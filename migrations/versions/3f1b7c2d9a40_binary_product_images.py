@@ -0,0 +1,78 @@
+"""store product images as binary with a content hash
+
+Revision ID: 3f1b7c2d9a40
+Revises: 6225e6daea71
+Create Date: 2025-09-02 10:14:52.381904
+
+"""
+import base64
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1b7c2d9a40'
+down_revision = '6225e6daea71'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+
+def _convert(source, target, convert, with_hash):
+    bind = op.get_bind()
+    images = sa.table(
+        'product_images',
+        sa.column('id', sa.Integer),
+        sa.column(source),
+        sa.column(target),
+        sa.column('content_hash', sa.String),
+    )
+
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(images.c.id, images.c[source])
+            .where(images.c.id > last_id)
+            .order_by(images.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        for image_id, value in rows:
+            converted = convert(value)
+            values = {target: converted}
+            if with_hash:
+                values['content_hash'] = hashlib.sha256(converted).hexdigest()
+            bind.execute(images.update().where(images.c.id == image_id).values(**values))
+
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    with op.batch_alter_table('product_images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_bin', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+    _convert('data', 'data_bin', base64.b64decode, with_hash=True)
+
+    with op.batch_alter_table('product_images', schema=None) as batch_op:
+        batch_op.drop_column('data')
+        batch_op.alter_column('data_bin', new_column_name='data', existing_type=sa.LargeBinary(), nullable=False)
+        batch_op.create_index(batch_op.f('ix_product_images_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('product_images', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_product_images_content_hash'))
+        batch_op.add_column(sa.Column('data_b64', sa.Text(), nullable=True))
+
+    _convert('data', 'data_b64', lambda raw: base64.b64encode(raw).decode('utf-8'), with_hash=False)
+
+    with op.batch_alter_table('product_images', schema=None) as batch_op:
+        batch_op.drop_column('content_hash')
+        batch_op.drop_column('data')
+        batch_op.alter_column('data_b64', new_column_name='data', existing_type=sa.Text(), nullable=False)
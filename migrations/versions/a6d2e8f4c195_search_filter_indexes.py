@@ -0,0 +1,30 @@
+"""indexes for brand and category filters with price and newest sorts
+
+Revision ID: a6d2e8f4c195
+Revises: f3c8b2a6d017
+Create Date: 2025-09-22 14:05:51.228907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d2e8f4c195'
+down_revision = 'f3c8b2a6d017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain CREATE INDEX, outside batch mode, leaves the full-text triggers on products alone
+    op.create_index('ix_products_brand_id_price_id', 'products', ['brand_id', 'price', 'id'], unique=False)
+    op.create_index('ix_products_brand_id_created_at_id', 'products', ['brand_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_product_category_category_id_product_id', 'product_category', ['category_id', 'product_id'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_product_category_category_id_product_id', table_name='product_category')
+    op.drop_index('ix_products_brand_id_created_at_id', table_name='products')
+    op.drop_index('ix_products_brand_id_price_id', table_name='products')
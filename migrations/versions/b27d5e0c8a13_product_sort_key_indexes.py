@@ -0,0 +1,28 @@
+"""indexes on product sort keys for keyset pagination
+
+Revision ID: b27d5e0c8a13
+Revises: 8c4e2a91f3b7
+Create Date: 2025-09-08 11:22:40.913275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b27d5e0c8a13'
+down_revision = '8c4e2a91f3b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.create_index('ix_products_price_id', ['price', 'id'], unique=False)
+        batch_op.create_index('ix_products_created_at_id', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('ix_products_created_at_id')
+        batch_op.drop_index('ix_products_price_id')
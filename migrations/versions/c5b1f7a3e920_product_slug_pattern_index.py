@@ -0,0 +1,29 @@
+"""prefix index on product slugs for suffix allocation on Postgres
+
+Revision ID: c5b1f7a3e920
+Revises: a6d2e8f4c195
+Create Date: 2025-09-24 10:31:08.417562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5b1f7a3e920'
+down_revision = 'a6d2e8f4c195'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ix_products_slug follows the database collation and cannot serve LIKE 'prefix%' there.
+    # SQLite allocates slugs with a range on ix_products_slug instead, see Product.suffixed_slugs
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_index('ix_products_slug_pattern', 'products', ['slug'], unique=False,
+                        postgresql_ops={'slug': 'text_pattern_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_products_slug_pattern', table_name='products')
@@ -0,0 +1,52 @@
+"""materialized path column on categories
+
+Revision ID: d91a6f4b2c58
+Revises: b27d5e0c8a13
+Create Date: 2025-09-11 09:03:18.640921
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91a6f4b2c58'
+down_revision = 'b27d5e0c8a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('path', sa.String(length=255), nullable=True))
+        batch_op.create_index(batch_op.f('ix_categories_path'), ['path'], unique=False)
+
+    # The category tree is small, so compute every path in memory
+    bind = op.get_bind()
+    categories = sa.table(
+        'categories',
+        sa.column('id', sa.Integer),
+        sa.column('parent_id', sa.Integer),
+        sa.column('path', sa.String),
+    )
+    parents = dict(bind.execute(sa.select(categories.c.id, categories.c.parent_id)).all())
+
+    paths = {}
+
+    def path_of(category_id):
+        if category_id not in paths:
+            parent_id = parents[category_id]
+            prefix = path_of(parent_id) if parent_id is not None else '/'
+            paths[category_id] = f"{prefix}{category_id}/"
+        return paths[category_id]
+
+    for category_id in parents:
+        bind.execute(
+            categories.update().where(categories.c.id == category_id).values(path=path_of(category_id))
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_categories_path'))
+        batch_op.drop_column('path')
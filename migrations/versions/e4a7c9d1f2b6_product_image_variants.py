@@ -0,0 +1,37 @@
+"""resized webp variants of product images
+
+Revision ID: e4a7c9d1f2b6
+Revises: d91a6f4b2c58
+Create Date: 2025-09-12 10:41:52.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c9d1f2b6'
+down_revision = 'd91a6f4b2c58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing images get their variants from `flask image-variants`
+    op.create_table('product_image_variants',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('image_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=16), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=True),
+    sa.Column('mime_type', sa.String(length=50), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=True),
+    sa.Column('height', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['image_id'], ['product_images.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('image_id', 'name')
+    )
+
+
+def downgrade():
+    op.drop_table('product_image_variants')
@@ -0,0 +1,29 @@
+"""version and updated_at on products
+
+Revision ID: f3c8b2a6d017
+Revises: e4a7c9d1f2b6
+Create Date: 2025-09-15 09:12:37.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8b2a6d017'
+down_revision = 'e4a7c9d1f2b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ALTERs: a batch rebuild of products on SQLite would drop the full-text triggers
+    op.add_column('products', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('products', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    op.execute('UPDATE products SET updated_at = created_at')
+
+
+def downgrade():
+    op.drop_column('products', 'version')
+    op.drop_column('products', 'updated_at')
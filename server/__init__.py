@@ -6,8 +6,9 @@ from flask_migrate import Migrate
 
 from .config import flask_config
 from .cache import Cache
+from . import replicas
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': replicas.RoutingSession})
 migrate = Migrate()
 
 
@@ -17,16 +18,31 @@ def create_app(config_name=os.getenv('FLASK_ENV', 'production')):
     app.config.from_object(flask_config[config_name])
 
     app.cache = Cache(app)
-    
+
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', replicas.engine_options(app.config))
+    app.config.setdefault('SQLALCHEMY_BINDS', {}).update(replicas.replica_binds(app.config))
     db.init_app(app)
+    replicas.init_app(app, db)
     from . import models
     
     migrate.init_app(app, db, directory='./migrations')
 
+    from . import metrics
+    metrics.init_app(app)
+
+    from . import responses
+    responses.init_app(app)
+
+    from . import tasks
+    tasks.init_app(app)
+
     from .main import main as main_bp
     app.register_blueprint(main_bp)
 
     from .blueprints import api as api_bp
     app.register_blueprint(api_bp)
-    
+
+    from .commands import register_commands
+    register_commands(app)
+
     return app
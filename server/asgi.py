@@ -0,0 +1,145 @@
+"""ASGI adapter, see asgi.py in the project root.
+
+Views, SQLAlchemy and Redis calls stay synchronous: each request runs on a
+bounded thread pool, so one worker overlaps requests that are waiting on
+Postgres or Redis, like gunicorn's gthread workers. asgiref's stock
+WsgiToAsgi runs every request on one shared thread, which serializes them.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Request bodies above this size are spooled to a temporary file
+BODY_MEMORY_LIMIT = 64 * 1024
+
+
+def build_environ(scope, body):
+    """WSGI environ of an ASGI HTTP ``scope`` (PEP 3333), ``body`` being a file positioned at 0."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI strings are bytes decoded as latin-1
+        'SCRIPT_NAME': root_path.encode().decode('latin-1'),
+        'PATH_INFO': path.encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The whole body is read already, so it can be read to EOF without a Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+    for name, value in scope.get('headers', ()):
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        # Repeated headers are joined, as a WSGI server would
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+class ThreadPoolWsgiToAsgi:
+    """Serve a WSGI app over ASGI, running each request on a thread of a shared pool."""
+
+    def __init__(self, wsgi_application, threads=8):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f"unsupported ASGI scope type {scope['type']!r}")
+
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_MEMORY_LIMIT)
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self.serve, build_environ(scope, body), send, loop)
+        finally:
+            body.close()
+
+    async def lifespan(self, receive, send):
+        # Nothing to set up, the WSGI app is ready once imported
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def serve(self, environ, send, loop):
+        """Run the WSGI app on a pool thread, sending its response through the event loop."""
+        def sync_send(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('started'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['start'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            }
+            length = next((value for name, value in headers if name.lower() == 'content-length'), None)
+            response['length'] = int(length) if length is not None else None
+            return write
+
+        def write(output):
+            if not response.get('started'):
+                response['started'] = True
+                sync_send(response['start'])
+            if output:
+                sync_send({'type': 'http.response.body', 'body': output, 'more_body': True})
+
+        iterable = self.wsgi_application(environ, start_response)
+        try:
+            bytes_sent = 0
+            for output in iterable:
+                # Never send more than a Content-Length header allows
+                if response['length'] is not None:
+                    output = output[:response['length'] - bytes_sent]
+                write(output)
+                bytes_sent += len(output)
+                if bytes_sent == response['length']:
+                    break
+        finally:
+            # Runs Flask's teardown of streamed responses
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        write(b'')
+        sync_send({'type': 'http.response.body'})
+
+
+def create_asgi_app(app=None, threads=None):
+    if app is None:
+        from . import create_app
+        app = create_app()
+    threads = threads or int(os.environ.get('ASGI_THREADS', '8'))
+    return ThreadPoolWsgiToAsgi(app, threads=threads)
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
-from . import admin, products
+from . import admin, images, products
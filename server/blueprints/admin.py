@@ -1,61 +1,358 @@
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+
 from flask import request, jsonify, current_app
-from ..models import db, Product, ProductImage, Category
+from sqlalchemy.exc import IntegrityError
+from ..cache_keys import invalidate_products
+from ..models import db, Brand, Product, ProductImage, ProductImageVariant, Category, product_category, SLUG_RETRIES
+from ..thumbnails import schedule_variants
+from ..warmup import refresh_after_write
 from . import api
 
-@api.route('/products', methods=['POST'])
-def create_product():
-    data = request.json
+BULK_MAX_ITEMS = 5000
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+class ItemError(ValueError):
+    """A bulk item that fails validation; reported per item, the rest of the batch goes ahead."""
+
+
+def decode_images(images):
+    """[(raw bytes, mime type)] for an ``images`` payload.
 
-    # Validate required fields
-    title = data.get('title')
-    if not title:
-        return jsonify({'error': 'title required'}), 400
-
-    price = float(data.get('price', 0.0))
-    p = Product(
-        title=title,
-        description=data.get('description', ''),
-        price_cents=int(price * 100),
-        currency=data.get('currency', 'INR')
-    )
-
-    # Assign brand if provided
-    brand_id = data.get('brand_id')
-    if brand_id:
-        p.brand_id = brand_id
-
-    p.set_slug()
-
-    # Handle images — now expects Base64 strings
-    # Format: [{ "data": "<base64string>", "mime_type": "image/png" }, ...]
-    images = data.get('images', [])
-    for i, img in enumerate(images):
+    Format: [{ "data": "<base64string>", "mime_type": "image/png" }, ...] or
+    plain Base64 strings, which default to JPEG.
+    """
+    decoded = []
+    for i, img in enumerate(images or []):
         if isinstance(img, dict):
             base64_data = img.get('data')
             mime_type = img.get('mime_type', 'image/jpeg')
         else:
-            # Fallback: assume plain Base64 string and default to JPEG
             base64_data = img
             mime_type = 'image/jpeg'
 
         if base64_data:
-            pi = ProductImage(data=base64_data, mime_type=mime_type, position=i)
-            p.images.append(pi)
+            try:
+                decoded.append((base64.b64decode(base64_data, validate=True), mime_type))
+            except (binascii.Error, ValueError, TypeError):
+                raise ItemError(f'image {i} is not valid base64')
+    return decoded
+
+
+def product_values(data, partial=False):
+    """Column values for a product payload, validated. ``partial`` skips absent fields."""
+    if not isinstance(data, dict):
+        raise ItemError('expected an object')
+
+    values = {}
+    if not partial or 'title' in data:
+        title = data.get('title')
+        if not title or not isinstance(title, str):
+            raise ItemError('title required')
+        values['title'] = checked_length('title', title)
+    if not partial or 'description' in data:
+        values['description'] = data.get('description') or ''
+    if not partial or 'price' in data:
+        try:
+            price = float(data.get('price') or 0.0)
+        except (TypeError, ValueError):
+            raise ItemError('price must be a number')
+        # float() accepts "nan", "inf" and "1e400"
+        if not math.isfinite(price):
+            raise ItemError('price must be a finite number')
+        if price < 0:
+            raise ItemError('price must not be negative')
+        values['price'] = round(price * 100)
+    if not partial or 'currency' in data:
+        currency = data.get('currency') or 'INR'
+        if not isinstance(currency, str):
+            raise ItemError('currency must be a string')
+        values['currency'] = checked_length('currency', currency)
+    if data.get('brand_id') is not None or (partial and 'brand_id' in data):
+        brand_id = data.get('brand_id')
+        if brand_id is not None and (not isinstance(brand_id, int) or isinstance(brand_id, bool)):
+            raise ItemError('brand_id must be an integer')
+        values['brand_id'] = brand_id
+    return values
+
+
+def checked_length(name, value):
+    # Postgres rejects overlong strings, which would abort the whole batch
+    limit = getattr(Product, name).type.length
+    if len(value) > limit:
+        raise ItemError(f'{name} must be at most {limit} characters')
+    return value
+
+
+def category_ids_of(data):
+    ids = data.get('category_ids') or []
+    if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        raise ItemError('category_ids must be a list of integers')
+    return list(dict.fromkeys(ids))
+
 
-    # Handle categories
-    cat_ids = data.get('category_ids', [])
-    for cid in cat_ids:
-        cat = Category.query.get(cid)
-        if cat:
-            p.categories.append(cat)
+def existing_ids(model, ids):
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return set()
+    return set(db.session.scalars(db.select(model.id).where(model.id.in_(ids))))
+
+
+@api.route('/products', methods=['POST'])
+def create_product():
+    data = request.json
+
+    try:
+        values = product_values(data)
+        images = decode_images(data.get('images'))
+        cat_ids = category_ids_of(data)
+    except ItemError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Unknown brands and categories are ignored, as before
+    if values.get('brand_id') not in existing_ids(Brand, [values.get('brand_id')]):
+        values.pop('brand_id', None)
+    p = Product(**values)
+
+    for i, (raw, mime_type) in enumerate(images):
+        pi = ProductImage(mime_type=mime_type, position=i)
+        pi.set_data(raw)
+        p.images.append(pi)
 
     # Save to DB
-    db.session.add(p)
+    p.save_with_slug()
+    if cat_ids:
+        p.categories = db.session.scalars(db.select(Category).where(Category.id.in_(cat_ids))).all()
     db.session.commit()
 
-    # Invalidate cache if used
-    if hasattr(current_app, "cache"):
-        current_app.cache.delete('product:*')
-        current_app.cache.delete('filters:*')
+    # A new product can show up in any search page or facet count, and its
+    # slug may have been cached as a miss
+    invalidate_products(current_app.cache, [p.slug])
+    schedule_variants([img.id for img in p.images])
 
     return jsonify(p.to_dict()), 201
+
+
+def bulk_items():
+    """Items of a JSON array or NDJSON body, as (index, item or ItemError) pairs."""
+    if request.mimetype in NDJSON_MIMETYPES:
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(ItemError('invalid JSON'))
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            raise ItemError('expected a JSON array or NDJSON body')
+
+    if len(items) > BULK_MAX_ITEMS:
+        raise ItemError(f'at most {BULK_MAX_ITEMS} items per request')
+    return list(enumerate(items))
+
+
+def bulk_response(results, status_key):
+    results.sort(key=lambda r: r['index'])
+    errors = sum(1 for r in results if 'error' in r)
+    return jsonify({status_key: len(results) - errors, 'errors': errors, 'results': results})
+
+
+def check_references(valid, errors):
+    """Drop items referencing missing brands or categories, with one IN query per table."""
+    brands = existing_ids(Brand, [item['values'].get('brand_id') for _, item in valid])
+    categories = existing_ids(Category, [c for _, item in valid for c in item.get('category_ids') or ()])
+
+    checked = []
+    for index, item in valid:
+        brand_id = item['values'].get('brand_id')
+        missing = [c for c in item.get('category_ids') or () if c not in categories]
+        if brand_id is not None and brand_id not in brands:
+            errors.append({'index': index, 'error': f'brand {brand_id} does not exist'})
+        elif missing:
+            errors.append({'index': index, 'error': f'categories {missing} do not exist'})
+        else:
+            checked.append((index, item))
+    return checked
+
+
+@api.route('/products/bulk', methods=['POST'])
+def bulk_create_products():
+    try:
+        items = bulk_items()
+    except ItemError as e:
+        return jsonify({'error': str(e)}), 400
+
+    valid, results = [], []
+    for index, data in items:
+        try:
+            if isinstance(data, ItemError):
+                raise data
+            valid.append((index, {
+                'values': product_values(data),
+                'images': decode_images(data.get('images')),
+                'category_ids': category_ids_of(data),
+            }))
+        except ItemError as e:
+            results.append({'index': index, 'error': str(e)})
+    valid = check_references(valid, results)
+
+    for attempt in range(SLUG_RETRIES):
+        try:
+            with db.session.begin_nested():
+                created, image_ids = insert_products([item for _, item in valid])
+            break
+        except IntegrityError:
+            # A concurrent insert took one of the slugs, allocate again
+            if attempt == SLUG_RETRIES - 1:
+                raise
+    db.session.commit()
+
+    for (index, _), (product_id, slug) in zip(valid, created):
+        results.append({'index': index, 'id': product_id, 'slug': slug})
+    if created:
+        refresh_after_write([slug for _, slug in created])
+        schedule_variants(image_ids)
+    return bulk_response(results, 'created'), 201 if created else 200
+
+
+def insert_products(items):
+    """Insert validated items with one statement per table, returning ([(id, slug)], image ids)."""
+    if not items:
+        return [], []
+
+    slugs = Product.allocate_slugs([item['values']['title'] for item in items])
+    product_ids = db.session.execute(
+        db.insert(Product).returning(Product.id, sort_by_parameter_order=True),
+        [{**item['values'], 'slug': slug} for item, slug in zip(items, slugs)],
+    ).scalars().all()
+
+    links = [
+        {'product_id': product_id, 'category_id': category_id}
+        for product_id, item in zip(product_ids, items) for category_id in item['category_ids']
+    ]
+    if links:
+        db.session.execute(db.insert(product_category), links)
+
+    images = [
+        {
+            'product_id': product_id,
+            'data': raw,
+            'content_hash': ProductImage.hash_data(raw),
+            'mime_type': mime_type,
+            'position': position,
+        }
+        for product_id, item in zip(product_ids, items)
+        for position, (raw, mime_type) in enumerate(item['images'])
+    ]
+    image_ids = db.session.execute(
+        db.insert(ProductImage).returning(ProductImage.id), images
+    ).scalars().all() if images else []
+    return list(zip(product_ids, slugs)), image_ids
+
+
+def bulk_targets(items, results):
+    """Validated (index, product id, item) for items naming an existing product by ``id``."""
+    wanted = []
+    for index, data in items:
+        if isinstance(data, ItemError):
+            results.append({'index': index, 'error': str(data)})
+        elif isinstance(data, int) or (isinstance(data, dict) and isinstance(data.get('id'), int)):
+            wanted.append((index, data if isinstance(data, int) else data['id'], data))
+        else:
+            results.append({'index': index, 'error': 'id required'})
+
+    slugs = dict(db.session.execute(
+        db.select(Product.id, Product.slug).where(Product.id.in_({product_id for _, product_id, _ in wanted}))
+    ).all()) if wanted else {}
+
+    targets, seen = [], set()
+    for index, product_id, data in wanted:
+        if product_id not in slugs:
+            results.append({'index': index, 'error': f'product {product_id} does not exist'})
+        elif product_id in seen:
+            results.append({'index': index, 'error': f'product {product_id} appears more than once'})
+        else:
+            seen.add(product_id)
+            targets.append((index, product_id, data))
+    return targets, slugs
+
+
+@api.route('/products/bulk', methods=['PATCH'])
+def bulk_update_products():
+    try:
+        items = bulk_items()
+    except ItemError as e:
+        return jsonify({'error': str(e)}), 400
+
+    results = []
+    targets, slugs = bulk_targets(items, results)
+
+    valid = []
+    for index, product_id, data in targets:
+        try:
+            item = {'id': product_id, 'values': product_values(data, partial=True)}
+            if 'category_ids' in data:
+                item['category_ids'] = category_ids_of(data)
+            valid.append((index, item))
+        except ItemError as e:
+            results.append({'index': index, 'error': str(e)})
+    valid = check_references(valid, results)
+
+    # Slugs stay as they are so product URLs keep working after a title change.
+    # Every row is updated, even when only its categories change, so its version moves.
+    now = datetime.utcnow()
+    updates = [{'id': item['id'], 'updated_at': now, **item['values']} for _, item in valid]
+    if updates:
+        db.session.execute(db.update(Product), updates)
+
+    relinked = [item for _, item in valid if 'category_ids' in item]
+    if relinked:
+        db.session.execute(db.delete(product_category).where(
+            product_category.c.product_id.in_([item['id'] for item in relinked])
+        ))
+        links = [
+            {'product_id': item['id'], 'category_id': category_id}
+            for item in relinked for category_id in item['category_ids']
+        ]
+        if links:
+            db.session.execute(db.insert(product_category), links)
+    db.session.commit()
+
+    for index, item in valid:
+        results.append({'index': index, 'id': item['id'], 'slug': slugs[item['id']]})
+    if valid:
+        refresh_after_write([slugs[item['id']] for _, item in valid])
+    return bulk_response(results, 'updated')
+
+
+@api.route('/products/bulk', methods=['DELETE'])
+def bulk_delete_products():
+    """Deletes products named by id, either bare integers or objects with an ``id``."""
+    try:
+        items = bulk_items()
+    except ItemError as e:
+        return jsonify({'error': str(e)}), 400
+
+    results = []
+    targets, slugs = bulk_targets(items, results)
+    ids = [product_id for _, product_id, _ in targets]
+
+    if ids:
+        db.session.execute(db.delete(product_category).where(product_category.c.product_id.in_(ids)))
+        image_ids = db.select(ProductImage.id).where(ProductImage.product_id.in_(ids))
+        db.session.execute(db.delete(ProductImageVariant).where(ProductImageVariant.image_id.in_(image_ids)))
+        db.session.execute(db.delete(ProductImage).where(ProductImage.product_id.in_(ids)))
+        db.session.execute(db.delete(Product).where(Product.id.in_(ids)))
+        db.session.commit()
+        refresh_after_write([slugs[product_id] for product_id in ids])
+
+    for index, product_id, _ in targets:
+        results.append({'index': index, 'id': product_id, 'slug': slugs[product_id]})
+    return bulk_response(results, 'deleted')
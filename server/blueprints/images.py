@@ -0,0 +1,42 @@
+from flask import abort, redirect, request, current_app, url_for
+from ..models import db, ProductImage, ProductImageVariant
+from ..thumbnails import VARIANTS
+from . import api
+
+
+def send_image(img):
+    # Only metadata is loaded by the caller, the image bytes are a deferred column
+    response = current_app.response_class(mimetype=img.mime_type or 'image/jpeg')
+    response.set_etag(img.content_hash)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['IMAGE_CACHE_MAX_AGE']
+    response.cache_control.immutable = True
+
+    # Images never change once stored, so a matching ETag skips loading the blob
+    if img.content_hash and img.content_hash in request.if_none_match:
+        response.status_code = 304
+        return response
+
+    response.set_data(img.data)
+    return response
+
+
+@api.route('/images/<int:image_id>', methods=['GET'])
+def product_image(image_id):
+    return send_image(db.get_or_404(ProductImage, image_id))
+
+
+@api.route('/images/<int:image_id>/<name>', methods=['GET'])
+def product_image_variant(image_id, name):
+    if name not in VARIANTS:
+        abort(404)
+
+    variant = db.session.scalar(db.select(ProductImageVariant).filter_by(image_id=image_id, name=name))
+    if variant is not None:
+        return send_image(variant)
+
+    # Not rendered (yet): send the original, without letting caches pin it to this URL
+    db.get_or_404(ProductImage, image_id)
+    response = redirect(url_for('.product_image', image_id=image_id))
+    response.cache_control.no_cache = True
+    return response
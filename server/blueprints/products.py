@@ -1,32 +1,193 @@
-from flask import request, jsonify, current_app
-from ..models import Product, Category, Brand
+import math
+
+from flask import request, jsonify, current_app, abort
+from ..cache_keys import filters_key, product_fields_key, product_key, search_key
+from ..facets import compute_facets
+from ..fields import InvalidFields, parse_fields
+from ..models import Product, db
+from ..replicas import read_replica
+from ..pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter
+from ..responses import encode_stream, render_json, send_rendered, send_stream
+from ..search import SORT_KEY_SIZE, InvalidSort, filter_products, resolve_sort, sort_key
 from . import api
 
+PRODUCT_CACHE_TTL = 30 * 60
+STREAM_BATCH_SIZE = 100
+
+DETAIL_FIELDS = Product.FIELDS + ('breadcrumb',)
+DEFAULT_DETAIL_FIELDS = Product.DEFAULT_FIELDS + ('breadcrumb',)
+
+
+def build_product_payload(slug, fields=DEFAULT_DETAIL_FIELDS):
+    """The detail payload and its ETag, or (None, None) for an unknown slug."""
+    # The breadcrumb follows the first category
+    loaded = fields + ('categories',) if 'breadcrumb' in fields else fields
+    product = Product.query.options(
+        *Product.serializer_options(loaded), db.undefer(Product.version)
+    ).filter_by(slug=slug).first()
+    if product is None:
+        return None, None
+
+    payload = product.to_dict([f for f in fields if f != 'breadcrumb'])
+    if 'breadcrumb' in fields:
+        payload['breadcrumb'] = product.categories[0].breadcrumb() if product.categories else []
+    return payload, f"{product.id}.{product.version}"
+
+
+def search_rows(q='', category_id=None, brand_id=None, min_price=None, max_price=None, sort=None,
+                page=1, limit=12, after=None, fields=None):
+    """Match query and page query of a search, plus its sort.
+
+    The page query returns up to ``limit + 1`` rows of (product, *sort key),
+    the extra row telling whether there is a next page. Only the item
+    ``fields`` are selected, a grid asking for titles and thumbnails never
+    reads descriptions or categories.
+    """
+    query, rank = filter_products(q, category_id, brand_id, min_price, max_price)
+
+    sort = resolve_sort(sort, q)
+    columns, descending = sort_key(sort, rank)
+    items = query.options(*Product.serializer_options(fields)).order_by(
+        *[c.desc() if descending else c.asc() for c in columns]
+    )
+
+    if after is not None:
+        items = items.filter(keyset_filter(columns, after, descending))
+    else:
+        items = items.offset((page - 1) * limit)
+    return query, items.add_columns(*columns).limit(limit + 1), sort
+
+
+def search_filters(q='', category_id=None, brand_id=None, min_price=None, max_price=None):
+    # Facets depend only on the filter predicate, so every page and sort of
+    # the same search shares one cached copy
+    cache = current_app.cache
+    return cache.get_or_compute(
+        filters_key(cache, q=q, cat=category_id, brand=brand_id, min_price=min_price, max_price=max_price),
+        # Rebuilt inside the closure: a background refresh runs in its own session
+        lambda: compute_facets(filter_products(q, category_id, brand_id, min_price, max_price)[0]),
+        ttl=current_app.config['CACHE_TTL'],
+    )
+
+
+def build_search_payload(q='', category_id=None, brand_id=None, min_price=None, max_price=None, sort=None,
+                         page=1, limit=12, after=None, include_total=True, fields=None):
+    """Search response for already validated parameters, ``after`` being a decoded cursor."""
+    query, items, sort = search_rows(
+        q, category_id, brand_id, min_price, max_price, sort, page, limit, after, fields
+    )
+    total = query.count() if include_total else None
+
+    rows = items.all()
+    next_cursor = encode_cursor(sort, rows[limit - 1][1:]) if len(rows) > limit else None
+
+    return {
+        'total': total,
+        'page': None if after is not None else page,
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'items': [row[0].to_dict(fields) for row in rows[:limit]],
+        'filters': search_filters(q, category_id, brand_id, min_price, max_price)
+    }
+
+
+def stream_search_payload(q='', category_id=None, brand_id=None, min_price=None, max_price=None, sort=None,
+                          page=1, limit=12, after=None, include_total=True, fields=None):
+    """build_search_payload() as encoded chunks, items read in batches from a server-side cursor.
+
+    Memory and time to first byte stay flat however large ``limit`` is.
+    ``next_cursor`` and ``filters`` come after the items.
+    """
+    query, items, sort = search_rows(
+        q, category_id, brand_id, min_price, max_price, sort, page, limit, after, fields
+    )
+    head = {
+        'total': query.count() if include_total else None,
+        'page': None if after is not None else page,
+        'limit': limit,
+    }
+    state = {'last': None, 'more': False}
+
+    def products():
+        for position, row in enumerate(items.yield_per(STREAM_BATCH_SIZE)):
+            if position == limit:
+                state['more'] = True
+                break
+            state['last'] = tuple(row[1:])
+            yield row[0].to_dict(fields)
+
+    def tail():
+        return {
+            'next_cursor': encode_cursor(sort, state['last']) if state['more'] else None,
+            'filters': search_filters(q, category_id, brand_id, min_price, max_price),
+        }
+
+    return encode_stream(head, 'items', products(), tail, STREAM_BATCH_SIZE)
+
+
+def product_entry(cache, slug, fields=DEFAULT_DETAIL_FIELDS):
+    """Cache key and compute function of a product detail response."""
+    def compute():
+        payload, etag = build_product_payload(slug, fields)
+        return render_json(payload, etag) if payload is not None else None
+
+    key = product_key(slug) if fields == DEFAULT_DETAIL_FIELDS else product_fields_key(cache, slug, fields)
+    return key, compute
+
+
+def search_entry(cache, q='', category_id=None, brand_id=None, min_price=None, max_price=None, sort=None,
+                 page=1, limit=12, cursor=None, after=None, include_total=True, fields=Product.DEFAULT_FIELDS):
+    """Cache key and compute function of a search response, see build_search_payload()."""
+    key = search_key(
+        cache, q=q, cat=category_id, brand=brand_id, min_price=min_price, max_price=max_price, page=page,
+        limit=limit, sort=sort, cursor=cursor, total=int(include_total), fields=','.join(fields)
+    )
+    return key, lambda: render_json(build_search_payload(
+        q, category_id, brand_id, min_price, max_price, sort, page, limit, after, include_total, fields
+    ))
+
+
 @api.route('/products/<slug>', methods=['GET'])
+@read_replica
 def product_detail(slug):
-    cache_key = f"product:slug:{slug}"
-    cached = current_app.cache.get(cache_key)
-    if cached:
-        return jsonify(cached)
+    try:
+        fields = parse_fields(request.args, DETAIL_FIELDS, DEFAULT_DETAIL_FIELDS)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
 
-    product = Product.query.filter_by(slug=slug).first_or_404()
-    breadcrumb = []
-    if product.categories:
-        breadcrumb = product.categories[0].breadcrumb()
+    cache = current_app.cache
+    rendered = cache.get_or_compute(*product_entry(cache, slug, fields), ttl=PRODUCT_CACHE_TTL)
+    if rendered is None:
+        abort(404)
+    return send_rendered(rendered)
 
-    payload = product.to_dict()
-    payload['breadcrumb'] = breadcrumb
 
-    current_app.cache.set(cache_key, payload, ttl=30 * 60)
-    return jsonify(payload)
+PRICE_SORTS = {'asc': 'price', 'desc': '-price'}
+
+
+def price_arg(name):
+    """A price query parameter in cents, None when missing or not a price."""
+    value = request.args.get(name, type=float)
+    if value is None or not math.isfinite(value):
+        return None
+    return round(value * 100)
 
 
 @api.route('/products/search', methods=['GET'])
+@read_replica
 def product_search():
     q = request.args.get('q', '') or ''
-    category_id = request.args.get('category_id')
-    brand_id = request.args.get('brand_id')
-    sort_price = request.args.get('sort_price', None)
+    category_id = request.args.get('category_id', type=int)
+    brand_id = request.args.get('brand_id', type=int)
+    min_price = price_arg('min_price')
+    max_price = price_arg('max_price')
+    # sort_price=asc|desc is the older spelling of sort=price|-price
+    sort = request.args.get('sort') or PRICE_SORTS.get(request.args.get('sort_price'))
+    cursor = request.args.get('cursor') or None
+
+    # Counting matches is as expensive as the page query itself, so cursor
+    # clients only get a total when they ask for it
+    include_total = request.args.get('include_total', '0' if cursor else '1') == '1'
 
     try:
         page = int(request.args.get('page', 1))
@@ -38,63 +199,36 @@ def product_search():
     except ValueError:
         limit = 12
 
-    cache_key = f"search:q={q}:cat={category_id}:brand={brand_id}:page={page}:limit={limit}:sort_price={sort_price}"
-
-    cached_response = current_app.cache.get(cache_key)
-    if cached_response:
-        return jsonify(cached_response)
-
-    query = Product.query
-    if q:
-        query = query.filter(Product.title.ilike(f"%{q}%"))
-    if brand_id:
-        query = query.filter_by(brand_id=brand_id)
-    if category_id:
-        query = query.join(Product.categories).filter(Category.id == int(category_id))
-
-    total = query.count()
-    items = query
-
-    if sort_price:
-        if sort_price == 'asc':
-            items = items.order_by(Product.price_cents.asc())
-        elif sort_price == 'desc':
-            items = items.order_by(Product.price_cents.desc())
-
-    items = items.offset((page - 1) * limit).limit(limit)
-
-    data = [p.to_dict(include_images=True) for p in items.all()]
-
-    category_ids = set()
-    brand_ids = set()
-
-    for p in query.limit(500).all():
-        if p.brand_id:
-            brand_ids.add(p.brand_id)
-        for c in p.categories:
-            category_ids.add(c.id)
+    page = max(page, 1)
+    limit = max(limit, 1)
 
-    categories = [
-        {'id': c.id, 'name': c.name}
-        for c in Category.query.filter(Category.id.in_(list(category_ids))).all()
-    ] if category_ids else []
-
-    brands = [
-        {'id': b.id, 'name': b.name}
-        for b in Brand.query.filter(Brand.id.in_(list(brand_ids))).all()
-    ] if brand_ids else []
-
-    filters = {'categories': categories, 'brands': brands}
-
-    response_payload = {
-        'total': total,
-        'page': page,
-        'limit': limit,
-        'items': data,
-        'filters': filters
-    }
-
-    if total > 0 and data:
-        current_app.cache.set(cache_key, response_payload, ttl=current_app.config['CACHE_TTL'])
+    try:
+        fields = parse_fields(request.args, Product.FIELDS, Product.DEFAULT_FIELDS)
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify(response_payload)
+    try:
+        resolved_sort = resolve_sort(sort, q)
+    except InvalidSort as e:
+        return jsonify({'error': str(e)}), 400
+
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, resolved_sort, SORT_KEY_SIZE)
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+
+    # Large pages are not worth caching, and are sent as they are read
+    if limit > current_app.config['SEARCH_STREAM_MIN_LIMIT']:
+        return send_stream(stream_search_payload(
+            q, category_id, brand_id, min_price, max_price, sort, page, limit, after, include_total, fields
+        ))
+
+    cache = current_app.cache
+    key, compute = search_entry(
+        cache, q, category_id, brand_id, min_price, max_price, sort, page, limit, cursor, after, include_total,
+        fields
+    )
+    rendered = cache.get_or_compute(key, compute, ttl=current_app.config['CACHE_TTL'])
+    return send_rendered(rendered)
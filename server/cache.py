@@ -1,32 +1,555 @@
-import redis, json
+import contextvars
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import msgpack
+import redis
 from flask import current_app
 
+from .metrics import CACHE_LATENCY, CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'cache:invalidate'
+
+# Generations key() uses instead of the published ones, while bump() warms them
+_pinned_versions = contextvars.ContextVar('pinned_versions', default={})
+
+
+def encode(value):
+    # msgpack keeps bytes (pre-rendered response bodies) as-is, where JSON
+    # would need base64, and decodes structured values faster than json
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def decode(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+class LocalCache:
+    """Size-bounded in-process LRU with a TTL per entry.
+
+    Values are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        ttl = min(ttl, self.ttl) if ttl else self.ttl
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        # Unlike get(), not counted as a hit or miss
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[1] > time.monotonic()
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
 class Cache:
+    """Optional in-process L1 in front of Redis (L2).
+
+    Deletes are broadcast over Redis pub/sub so every worker drops its L1 copy.
+    Without REDIS_URL, or while Redis is unreachable, the cache runs L1-only
+    (or is a no-op when CACHE_L1_SIZE is 0) instead of failing requests.
+    """
+
     def __init__(self, app=None):
         self.client = None
+        self.local = None
+        self.url = None
+        self.node_id = uuid.uuid4().hex
+        self.retry_interval = 5
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.l2_errors = 0
+        self._down_until = 0
+        self._versions = {}
+        self._reserved = {}
+        self._versions_lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.stampede_protection = True
+        self.stale_ttl = 300
+        self.lock_timeout = 10
+        self.lock_wait = 2
+        self.negative_ttl = 5
+        self.beta = 1.0
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
         if app:
             self.init_app(app)
 
     def init_app(self, app):
-        url = app.config.get('REDIS_URL')
+        url = self.url = app.config.get('REDIS_URL')
+        timeout = app.config.get('CACHE_REDIS_TIMEOUT', 0.5)
         try:
-            self.client = redis.from_url(url) if url else None
+            self.client = redis.from_url(
+                url, socket_timeout=timeout, socket_connect_timeout=timeout
+            ) if url else None
         except Exception:
             self.client = None
 
+        size = app.config.get('CACHE_L1_SIZE', 0)
+        self.local = LocalCache(size, app.config.get('CACHE_L1_TTL', 60)) if size else None
+        self.retry_interval = app.config.get('CACHE_REDIS_RETRY_INTERVAL', 5)
+        self.stampede_protection = app.config.get('CACHE_STAMPEDE_PROTECTION', True)
+        self.stale_ttl = app.config.get('CACHE_STALE_TTL', 300)
+        self.lock_timeout = app.config.get('CACHE_LOCK_TIMEOUT', 10)
+        self.lock_wait = app.config.get('CACHE_LOCK_WAIT', 2)
+        self.negative_ttl = app.config.get('CACHE_NEGATIVE_TTL', 5)
+        self.beta = app.config.get('CACHE_EARLY_EXPIRATION_BETA', 1.0)
+
+    @property
+    def redis_available(self):
+        return self.client is not None and time.monotonic() >= self._down_until
+
+    @property
+    def shared(self):
+        """Whether a computed value can be seen by another request (an L1 or Redis is up)."""
+        return self.local is not None or self.redis_available
+
+    def _redis_failed(self, exc):
+        # Skip Redis for a while rather than paying a timeout on every request
+        self.l2_errors += 1
+        CACHE_REQUESTS.labels('l2', 'error').inc()
+        self._down_until = time.monotonic() + self.retry_interval
+        logger.warning('redis unavailable, serving from local cache only: %s', exc)
+
     def get(self, key):
-        if not self.client:
+        if self.local is not None:
+            value = self.local.get(key)
+            CACHE_REQUESTS.labels('l1', 'miss' if value is None else 'hit').inc()
+            if value is not None:
+                return value
+
+        if not self.redis_available:
+            return None
+        self._ensure_listener()
+        try:
+            with CACHE_LATENCY.labels('get').time():
+                v = self.client.get(key)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return None
+
+        if not v:
+            self.l2_misses += 1
+            CACHE_REQUESTS.labels('l2', 'miss').inc()
+            return None
+        try:
+            value = decode(v)
+        except (ValueError, msgpack.UnpackException):
+            # Written by an older release with another codec
+            self.l2_misses += 1
+            CACHE_REQUESTS.labels('l2', 'miss').inc()
             return None
-        v = self.client.get(key)
-        return json.loads(v) if v else None
+        self.l2_hits += 1
+        CACHE_REQUESTS.labels('l2', 'hit').inc()
+        if self.local is not None:
+            self.local.set(key, value)
+        return value
 
     def set(self, key, value, ttl=None):
-        if not self.client:
+        if self.local is not None:
+            self.local.set(key, value, ttl)
+        if not self.redis_available:
             return
-        self.client.set(key, json.dumps(value), ex=ttl)
+        try:
+            with CACHE_LATENCY.labels('set').time():
+                self.client.set(key, encode(value), ex=ttl)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def cached(self, keys):
+        """The subset of ``keys`` held in the L1 or in Redis, with one round trip."""
+        keys = list(keys)
+        found = {key for key in keys if key in self.local} if self.local is not None else set()
+        missing = [key for key in keys if key not in found]
+        if not missing or not self.redis_available:
+            return found
+        try:
+            with self.client.pipeline(transaction=False) as pipe:
+                for key in missing:
+                    pipe.exists(key)
+                found.update(key for key, exists in zip(missing, pipe.execute()) if exists)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+        return found
 
-    def delete(self, pattern):
-        if not self.client:
+    def delete_many(self, keys):
+        """Delete exact keys in one Redis round trip."""
+        keys = list(keys)
+        if not keys:
             return
-        for key in self.client.scan_iter(pattern):
+        if self.local is not None:
+            for key in keys:
+                self.local.delete(key)
+        if not self.redis_available:
+            return
+        self._ensure_listener()
+        try:
+            with self.client.pipeline(transaction=False) as pipe:
+                pipe.publish(INVALIDATION_CHANNEL, json.dumps({'node': self.node_id, 'keys': keys}))
+                pipe.delete(*keys)
+                pipe.execute()
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def delete(self, key):
+        """Delete one key; there is no pattern delete, use namespaces (see bump) for groups of keys."""
+        if self.local is not None:
+            self.local.delete(key)
+        if not self.redis_available:
+            return
+        try:
+            self._publish(key)
             self.client.delete(key)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def namespace_version(self, namespace):
+        """Current generation of a key namespace, see key() and bump()."""
+        pinned = _pinned_versions.get()
+        if namespace in pinned:
+            return pinned[namespace]
+
+        version_key = f"ns:{namespace}"
+        if self.local is not None:
+            version = self.local.get(version_key)
+            if version is not None:
+                return version
+
+        version = self._versions.get(namespace, 0)
+        if self.redis_available:
+            try:
+                version = int(self.client.get(version_key) or 0)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+        if self.local is not None:
+            self.local.set(version_key, version)
+        return version
+
+    def key(self, namespace, suffix):
+        return f"{namespace}:v{self.namespace_version(namespace)}:{suffix}"
+
+    def bump(self, *namespaces, warm=None):
+        """Invalidate every key in the namespaces in O(1).
+
+        Keys embed the namespace generation, so bumping it orphans the old keys
+        and they age out through their TTL. ``warm`` is called first, with
+        key() returning keys of the new generations, so it can fill them while
+        readers still get the old ones.
+        """
+        reserved = {namespace: self._reserve_version(namespace) for namespace in namespaces}
+        if warm is not None:
+            token = _pinned_versions.set({**_pinned_versions.get(), **{ns: v for ns, (_, v) in reserved.items()}})
+            try:
+                warm()
+            except Exception:
+                logger.exception('warming %s failed', ', '.join(namespaces))
+            finally:
+                _pinned_versions.reset(token)
+
+        for namespace, (base, version) in reserved.items():
+            if not self._publish_version(namespace, base, version):
+                # Another write went live meanwhile, and our warm-up may predate
+                # it: go to a generation nobody has filled instead
+                _, version = self._reserve_version(namespace)
+                self._publish_version(namespace, None, version)
+
+    def _reserve_version(self, namespace):
+        """(live generation, an unused later generation) of a namespace."""
+        with self._versions_lock:
+            base = self._versions.get(namespace, 0)
+            version = self._reserved[namespace] = max(self._reserved.get(namespace, 0), base) + 1
+        if not self.redis_available:
+            return base, version
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.get(f"ns:{namespace}")
+                pipe.incr(f"ns:{namespace}:next")
+                base, version = pipe.execute()
+            base = int(base or 0)
+            if version <= base:
+                version = self.client.incrby(f"ns:{namespace}:next", base - version + 1)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+        return base, version
+
+    def _publish_version(self, namespace, base, version):
+        """Make ``version`` live if the live generation is still ``base`` (any, for None)."""
+        version_key = f"ns:{namespace}"
+        with self._versions_lock:
+            if base is not None and self._versions.get(namespace, 0) != base and not self.redis_available:
+                return False
+            self._versions[namespace] = max(self._versions.get(namespace, 0), version)
+        if self.local is not None:
+            self.local.delete(version_key)
+        if not self.redis_available:
+            return True
+        self._ensure_listener()
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.watch(version_key)
+                live = int(pipe.get(version_key) or 0)
+                if (base is not None and live != base) or live >= version:
+                    return False
+                pipe.multi()
+                pipe.set(version_key, version)
+                pipe.publish(INVALIDATION_CHANNEL, json.dumps({'node': self.node_id, 'keys': [version_key]}))
+                pipe.execute()
+            return True
+        except redis.WatchError:
+            return False
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return True
+
+    def get_or_compute(self, key, compute, ttl):
+        """Cache-aside read that keeps a hot key from stampeding the database.
+
+        Entries are fresh for ``ttl`` seconds and then served stale for up to
+        ``stale_ttl`` more while a single worker, holding a short Redis lock,
+        refreshes them in the background. Fresh entries are also refreshed
+        early with a probability that grows as expiry nears and with how slow
+        the value is to compute (XFetch), so a hot key rarely expires at all.
+        On a hard miss, workers that lose the lock wait for the winner's
+        result, until it is stored or the lock is released. ``compute`` runs
+        outside the request (it must not touch ``flask.request``); a None
+        result is cached for ``negative_ttl`` seconds, so waiters see it too.
+        Without Redis or an L1 there is nothing to share and nothing to wait
+        for, so every call computes.
+        """
+        if not self.stampede_protection or not self.shared:
+            value = self.get(key)
+            if value is None:
+                value = compute()
+                if value is not None:
+                    self.set(key, value, ttl=ttl)
+            return value
+
+        entry = self._get_entry(key)
+        if entry is not None:
+            # -log(random()) is exponentially distributed, see the XFetch paper
+            early = entry['delta'] * self.beta * -math.log(random.random() or 1e-12)
+            if time.time() + early < entry['expires']:
+                return entry['value']
+            token = self._acquire_lock(key)
+            if token:
+                self._refresh_in_background(key, compute, ttl, token)
+            return entry['value']
+
+        token = self._acquire_lock(key)
+        if token:
+            try:
+                return self._compute_entry(key, compute, ttl)
+            finally:
+                self._release_lock(key, token)
+
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            # Checked before the entry: the holder stores it, then releases
+            held = self._lock_held(key)
+            entry = self._get_entry(key)
+            if entry is not None:
+                return entry['value']
+            if not held:
+                break
+        # The lock holder failed, is too slow or died, compute it ourselves
+        return self._compute_entry(key, compute, ttl)
+
+    def refresh(self, key, compute, ttl):
+        """Recompute ``key`` now and store it as get_or_compute() would, e.g. to warm the cache."""
+        if not self.stampede_protection or not self.shared:
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl=ttl)
+            return value
+        return self._compute_entry(key, compute, ttl)
+
+    def _get_entry(self, key):
+        entry = self.get(key)
+        if isinstance(entry, dict) and 'expires' in entry and 'value' in entry:
+            return entry
+        return None
+
+    def _compute_entry(self, key, compute, ttl):
+        started = time.time()
+        value = compute()
+        delta = time.time() - started
+        if value is None:
+            # Misses are not served stale, the entry is gone once it expires
+            ttl, stale_ttl = self.negative_ttl, 0
+        else:
+            stale_ttl = self.stale_ttl
+        entry = {'value': value, 'expires': started + ttl, 'delta': delta}
+        self.set(key, entry, ttl=ttl + stale_ttl)
+        # Other workers may hold the stale entry in their L1
+        if self.local is not None and self.redis_available:
+            try:
+                self._publish(key)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        return value
+
+    def _refresh_in_background(self, key, compute, ttl, token):
+        app = current_app._get_current_object()
+
+        def refresh():
+            try:
+                with app.app_context():
+                    self._compute_entry(key, compute, ttl)
+            except Exception:
+                logger.exception('background refresh of %s failed', key)
+            finally:
+                self._release_lock(key, token)
+
+        threading.Thread(target=refresh, name='cache-refresh', daemon=True).start()
+
+    def _lock_held(self, key):
+        with self._inflight_lock:
+            if key in self._inflight:
+                return True
+        if not self.redis_available:
+            return False
+        try:
+            return bool(self.client.exists(f"lock:{key}"))
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return False
+
+    def _acquire_lock(self, key):
+        """Returns a token when this worker should (re)compute ``key``, else None."""
+        token = uuid.uuid4().hex
+        # Single-flight inside the process first, then across processes
+        with self._inflight_lock:
+            if key in self._inflight:
+                return None
+            self._inflight[key] = token
+
+        if self.redis_available:
+            try:
+                acquired = self.client.set(f"lock:{key}", token, nx=True, px=int(self.lock_timeout * 1000))
+            except redis.RedisError as e:
+                self._redis_failed(e)
+                acquired = True
+            if not acquired:
+                with self._inflight_lock:
+                    self._inflight.pop(key, None)
+                return None
+        return token
+
+    def _release_lock(self, key, token):
+        with self._inflight_lock:
+            if self._inflight.get(key) == token:
+                del self._inflight[key]
+
+        if not self.redis_available:
+            return
+        lock_key = f"lock:{key}"
+        try:
+            # Only delete the lock if it is still ours (it may have timed out
+            # and been taken by another worker)
+            with self.client.pipeline() as pipe:
+                pipe.watch(lock_key)
+                if pipe.get(lock_key) == token.encode():
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    pipe.execute()
+        except redis.WatchError:
+            pass
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def _publish(self, key):
+        self._ensure_listener()
+        self.client.publish(INVALIDATION_CHANNEL, json.dumps({'node': self.node_id, 'keys': [key]}))
+
+    def stats(self):
+        stats = {'l2_hits': self.l2_hits, 'l2_misses': self.l2_misses, 'l2_errors': self.l2_errors}
+        if self.local is not None:
+            stats.update({
+                'l1_hits': self.local.hits,
+                'l1_misses': self.local.misses,
+                'l1_evictions': self.local.evictions,
+                'l1_size': len(self.local),
+            })
+        return stats
+
+    def _ensure_listener(self):
+        # Started lazily and per process, so gunicorn workers forked from a
+        # preloaded app each get their own subscriber thread, and their own
+        # node id: with the inherited one they would skip each other's messages
+        if self.local is None or self._listener_pid == os.getpid():
+            return
+        with self._listener_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self.node_id = uuid.uuid4().hex
+            threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                # Blocking reads must not use the short socket timeout of self.client
+                client = redis.from_url(self.url, health_check_interval=30) if self.url else self.client
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Invalidations may have been missed while disconnected
+                self.local.clear()
+                for message in pubsub.listen():
+                    payload = json.loads(message['data'])
+                    if payload.get('node') != self.node_id:
+                        # 'pattern' is the single key sent by older releases
+                        for key in payload.get('keys') or [payload['pattern']]:
+                            self.local.delete(key)
+            except Exception as e:
+                logger.warning('cache invalidation listener disconnected: %s', e)
+                time.sleep(self.retry_interval)
@@ -0,0 +1,41 @@
+# Cache key layout shared by the read endpoints and everything that invalidates them.
+#
+# Search pages and facets live in versioned namespaces (see Cache.bump), so any
+# catalog write can drop all of them at once without scanning Redis. Detail
+# payloads are keyed per product and deleted individually; the sparse ones
+# (?fields=) share a namespace, as there is no listing every variant of a product.
+SEARCH = 'search'
+FILTERS = 'filters'
+PRODUCT_FIELDS = 'product-fields'
+
+
+def _suffix(params):
+    return ':'.join(f"{k}={params[k]}" for k in sorted(params))
+
+
+def search_key(cache, **params):
+    return cache.key(SEARCH, _suffix(params))
+
+
+def filters_key(cache, **params):
+    return cache.key(FILTERS, _suffix(params))
+
+
+def product_key(slug):
+    return f"product:slug:{slug}"
+
+
+def product_fields_key(cache, slug, fields):
+    return cache.key(PRODUCT_FIELDS, f"{slug}:{','.join(fields)}")
+
+
+def invalidate_products(cache, slugs=()):
+    """Drop cached data affected by writes to the given products.
+
+    Any product can appear in any search page or facet count, so those
+    namespaces are always bumped, in O(1). Detail keys are deleted before the
+    write returns, all of them in one round trip, so a changed product is
+    never served stale.
+    """
+    cache.bump(SEARCH, FILTERS, PRODUCT_FIELDS)
+    cache.delete_many(product_key(slug) for slug in slugs)
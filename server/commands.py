@@ -0,0 +1,95 @@
+import logging
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command('query-budget')
+@with_appcontext
+def query_budget():
+    """Fail if any read endpoint issues more SQL queries than its budget."""
+    from .testing import check_query_budgets
+
+    results = check_query_budgets(current_app._get_current_object())
+    if not results:
+        raise click.ClickException('no products in the database, seed it first')
+
+    failed = False
+    for name, (queries, budget) in results.items():
+        ok = queries <= budget
+        failed = failed or not ok
+        click.echo(f"{'ok  ' if ok else 'FAIL'} {name}: {queries} queries (budget {budget})")
+
+    if failed:
+        raise SystemExit(1)
+
+
+@click.command('image-variants')
+@click.option('--batch-size', default=500, show_default=True, help='images rendered per commit')
+@with_appcontext
+def image_variants(batch_size):
+    """Render thumbnails for images stored before variants existed."""
+    from . import db
+    from .models import ProductImage, ProductImageVariant
+    from .thumbnails import Image, generate_variants
+
+    if Image is None:
+        raise click.ClickException('Pillow is not installed')
+
+    missing = db.select(ProductImage.id).where(
+        ProductImage.id.not_in(db.select(ProductImageVariant.image_id))
+    ).order_by(ProductImage.id)
+    image_ids = db.session.scalars(missing).all()
+
+    stored = 0
+    with click.progressbar(range(0, len(image_ids), batch_size), label='Rendering variants') as batches:
+        for i in batches:
+            stored += generate_variants(image_ids[i:i + batch_size])
+    click.echo(f"Stored {stored} variants for {len(image_ids)} images")
+
+
+@click.command('worker')
+@click.option('--burst', is_flag=True, help='exit once the queue is empty')
+@with_appcontext
+def worker(burst):
+    """Run queued background tasks (TASK_QUEUE=redis)."""
+    from .tasks import Worker
+
+    app = current_app._get_current_object()
+    if app.config['TASK_QUEUE'] != 'redis':
+        raise click.ClickException('TASK_QUEUE is not redis, tasks run in the web process')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    runner = Worker(app, app.config['REDIS_URL'])
+    click.echo(f"worker {runner.id} waiting for tasks")
+    processed = runner.run(burst=burst)
+    click.echo(f"worker {runner.id} stopped after {processed} tasks")
+
+
+@click.group('cache')
+def cache():
+    """Manage the response cache."""
+
+
+@cache.command('warm')
+@click.option('--pages', type=int, help='pages per listing [CACHE_WARM_PAGES]')
+@click.option('--brands', type=int, help='brands with the most products [CACHE_WARM_BRANDS]')
+@click.option('--products', type=int, help='newest product detail pages [CACHE_WARM_PRODUCTS]')
+@click.option('--concurrency', type=int, help='parallel computations [CACHE_WARM_CONCURRENCY]')
+@with_appcontext
+def cache_warm(pages, brands, products, concurrency):
+    """Precompute the hot search and product pages."""
+    from .warmup import warm_cache
+
+    if current_app.cache.client is None:
+        click.echo('REDIS_URL is not set, entries only land in this process and are lost on exit', err=True)
+    stored, elapsed = warm_cache(pages, products, brands, concurrency)
+    click.echo(f"Warmed {stored} cache entries in {elapsed:.1f}s")
+
+
+def register_commands(app):
+    app.cli.add_command(query_budget)
+    app.cli.add_command(image_variants)
+    app.cli.add_command(worker)
+    app.cli.add_command(cache)
@@ -9,13 +9,77 @@ class Config:
 
     SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///catalog.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connections per process are DB_POOL_SIZE plus up to DB_MAX_OVERFLOW under load.
+    # Behind pgbouncer in transaction mode set DB_POOL_DISABLED=1 and let it do the pooling.
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+    DB_POOL_DISABLED = os.getenv('DB_POOL_DISABLED', '0') == '1'
+
+    # Comma separated read replicas for the read-only endpoints, see server/replicas.py
+    DB_REPLICA_URIS = [uri.strip() for uri in os.getenv('DB_REPLICA_URIS', '').split(',') if uri.strip()]
+    DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', '5'))
+    DB_REPLICA_CHECK_INTERVAL = int(os.getenv('DB_REPLICA_CHECK_INTERVAL', '10'))
+    DB_REPLICA_RETRY_INTERVAL = int(os.getenv('DB_REPLICA_RETRY_INTERVAL', '30'))
     
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     CACHE_TTL = int(os.getenv('CACHE_TTL', '3600'))
+    # In-process L1 in front of Redis; set CACHE_L1_SIZE=0 to disable it
+    CACHE_L1_SIZE = int(os.getenv('CACHE_L1_SIZE', '1024'))
+    CACHE_L1_TTL = int(os.getenv('CACHE_L1_TTL', '60'))
+    CACHE_REDIS_TIMEOUT = float(os.getenv('CACHE_REDIS_TIMEOUT', '0.5'))
+    CACHE_REDIS_RETRY_INTERVAL = int(os.getenv('CACHE_REDIS_RETRY_INTERVAL', '5'))
+    # Stampede protection for hot keys, see Cache.get_or_compute
+    CACHE_STAMPEDE_PROTECTION = os.getenv('CACHE_STAMPEDE_PROTECTION', '1') == '1'
+    CACHE_STALE_TTL = int(os.getenv('CACHE_STALE_TTL', '300'))
+    CACHE_LOCK_TIMEOUT = int(os.getenv('CACHE_LOCK_TIMEOUT', '10'))
+    CACHE_LOCK_WAIT = float(os.getenv('CACHE_LOCK_WAIT', '2'))
+    # How long a miss (e.g. an unknown slug) is remembered, so it is computed once
+    CACHE_NEGATIVE_TTL = int(os.getenv('CACHE_NEGATIVE_TTL', '5'))
+    CACHE_EARLY_EXPIRATION_BETA = float(os.getenv('CACHE_EARLY_EXPIRATION_BETA', '1.0'))
+
+    # What `flask cache warm` and bulk writes precompute, see server/warmup.py. CACHE_WARM_FIELDS
+    # must match the fields the product grid requests (src/components/ProductList.jsx)
+    CACHE_WARM_PAGES = int(os.getenv('CACHE_WARM_PAGES', '3'))
+    CACHE_WARM_BRANDS = int(os.getenv('CACHE_WARM_BRANDS', '20'))
+    CACHE_WARM_PRODUCTS = int(os.getenv('CACHE_WARM_PRODUCTS', '100'))
+    CACHE_WARM_CONCURRENCY = int(os.getenv('CACHE_WARM_CONCURRENCY', '4'))
+    CACHE_WARM_FIELDS = os.getenv('CACHE_WARM_FIELDS', 'id,slug,title,description,price,currency,thumbnail')
+
+    # JSON bodies above this size are sent compressed, cached ones are also stored that way.
+    # Brotli is used for clients that accept it when the brotli package is installed
+    RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', '1024'))
+    RESPONSE_COMPRESSION_LEVEL = int(os.getenv('RESPONSE_COMPRESSION_LEVEL', '6'))
+    RESPONSE_COMPRESSION_BROTLI = os.getenv('RESPONSE_COMPRESSION_BROTLI', '1') == '1'
+    RESPONSE_BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', '5'))
+    # Search pages with a larger limit are streamed from a server-side cursor and not cached
+    SEARCH_STREAM_MIN_LIMIT = int(os.getenv('SEARCH_STREAM_MIN_LIMIT', '100'))
+
+    # Cache-Control of the product read endpoints: browsers revalidate with the ETag every
+    # time, shared caches (nginx) reuse a response for s-maxage and then serve it stale
+    # for up to stale-while-revalidate seconds while they fetch a fresh copy
+    API_CACHE_MAX_AGE = int(os.getenv('API_CACHE_MAX_AGE', '0'))
+    API_CACHE_S_MAXAGE = int(os.getenv('API_CACHE_S_MAXAGE', '30'))
+    API_CACHE_STALE_WHILE_REVALIDATE = int(os.getenv('API_CACHE_STALE_WHILE_REVALIDATE', '60'))
+
+    IMAGE_CACHE_MAX_AGE = int(os.getenv('IMAGE_CACHE_MAX_AGE', str(365 * 24 * 3600)))
+    # Follow-up work of writes, see server/tasks.py: local, redis (run `flask worker`) or eager
+    TASK_QUEUE = os.getenv('TASK_QUEUE', 'local')
+    TASK_LOCAL_WORKERS = int(os.getenv('TASK_LOCAL_WORKERS', '2'))
+    TASK_MAX_RETRIES = int(os.getenv('TASK_MAX_RETRIES', '5'))
+    TASK_RETRY_BACKOFF = float(os.getenv('TASK_RETRY_BACKOFF', '2'))
+    TASK_RETRY_MAX_DELAY = float(os.getenv('TASK_RETRY_MAX_DELAY', '300'))
+
+    # Allow ?__profile=1 / X-Profile: 1 to return a cProfile report instead of the response
+    PROFILE_REQUESTS = os.getenv('PROFILE_REQUESTS', '0') == '1'
 
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    PROFILE_REQUESTS = True
 
 
 class ProductionConfig(Config):
@@ -23,6 +87,7 @@ class ProductionConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    PROFILE_REQUESTS = True
 
 
 flask_config = {
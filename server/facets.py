@@ -0,0 +1,64 @@
+import sqlalchemy as sa
+from sqlalchemy.orm import aliased
+
+from . import db
+from .models import Brand, Category, Product, product_category
+
+
+def _matching_ids(query):
+    return query.with_entities(Product.id).order_by(None).scalar_subquery()
+
+
+def brand_facets(query):
+    """Brands of the products matched by ``query`` with a product count each."""
+    count = sa.func.count(Product.id).label('count')
+    stmt = (
+        sa.select(Brand.id, Brand.name, count)
+        .join(Product, Product.brand_id == Brand.id)
+        .where(Product.id.in_(_matching_ids(query)))
+        .group_by(Brand.id, Brand.name)
+        .order_by(count.desc(), Brand.name)
+    )
+    return [{'id': id, 'name': name, 'count': n} for id, name, n in db.session.execute(stmt)]
+
+
+def category_facets(query):
+    """Categories of the products matched by ``query``, rolled up the category tree.
+
+    A parent's count is the number of distinct matching products in its whole
+    subtree, so a product listed under two sibling categories counts once.
+    """
+    # Both sides are DISTINCT so they are materialized once (SQLite would
+    # otherwise flatten them and evaluate the path LIKE once per matching row)
+    # and joined on equality
+    matched = (
+        sa.select(product_category.c.product_id, product_category.c.category_id)
+        .where(product_category.c.product_id.in_(_matching_ids(query)))
+        .distinct()
+        .subquery('matched')
+    )
+    # (category, ancestor) pairs: every ancestor's path is a prefix of the category's
+    descendant = aliased(Category)
+    ancestry = (
+        sa.select(descendant.id.label('category_id'), Category.id.label('ancestor_id'))
+        .join(Category, descendant.path.like(Category.path.concat('%')))
+        .distinct()
+        .subquery('ancestry')
+    )
+    count = sa.func.count(sa.distinct(matched.c.product_id)).label('count')
+    stmt = (
+        sa.select(Category.id, Category.name, Category.parent_id, count)
+        .select_from(matched)
+        .join(ancestry, ancestry.c.category_id == matched.c.category_id)
+        .join(Category, Category.id == ancestry.c.ancestor_id)
+        .group_by(Category.id, Category.name, Category.parent_id)
+        .order_by(count.desc(), Category.name)
+    )
+    return [
+        {'id': id, 'name': name, 'parent_id': parent_id, 'count': n}
+        for id, name, parent_id, n in db.session.execute(stmt)
+    ]
+
+
+def compute_facets(query):
+    return {'categories': category_facets(query), 'brands': brand_facets(query)}
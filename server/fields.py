@@ -0,0 +1,23 @@
+class InvalidFields(ValueError):
+    pass
+
+
+def _split(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+def parse_fields(args, allowed, default):
+    """Response fields picked by ``?fields=`` and ``?include=``, or ``default``.
+
+    ``fields`` replaces the default set and ``include`` adds to it, so
+    ``?include=thumbnail`` and ``?fields=id,title&include=brand`` both work.
+    The result follows the order of ``allowed``, so equal selections give equal
+    cache keys.
+    """
+    requested, included = _split(args.get('fields')), _split(args.get('include'))
+    unknown = (requested | included) - set(allowed)
+    if unknown:
+        raise InvalidFields(f"unknown fields: {', '.join(sorted(unknown))}")
+
+    selected = (requested or set(default)) | included
+    return tuple(name for name in allowed if name in selected)
@@ -0,0 +1,128 @@
+"""Prometheus metrics for requests, SQL queries and the cache, and opt-in request profiling.
+
+Under gunicorn set PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py) so /metrics
+aggregates every worker instead of whichever one answers the scrape.
+"""
+import cProfile
+import io
+import os
+import pstats
+import time
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess,
+)
+
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    # CLI commands (flask db upgrade) record metrics too, before gunicorn creates it
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency', ['method', 'endpoint', 'status'],
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response body size', ['endpoint'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+REQUEST_QUERIES = Histogram(
+    'db_queries_per_request', 'SQL statements executed per request', ['endpoint'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+REQUEST_QUERY_TIME = Histogram(
+    'db_query_seconds_per_request', 'Time spent in SQL per request', ['endpoint'],
+)
+QUERIES = Counter('db_queries', 'SQL statements executed', ['endpoint'])
+CACHE_REQUESTS = Counter('cache_requests', 'Cache lookups', ['layer', 'result'])
+CACHE_LATENCY = Histogram(
+    'cache_operation_duration_seconds', 'Redis round-trip time of cache operations', ['operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5),
+)
+
+PROFILE_LIMIT = 40
+
+
+def endpoint_label():
+    return request.url_rule.endpoint if request.url_rule else 'unmatched'
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    # Background cache refreshes and CLI commands run outside a request
+    endpoint = endpoint_label() if has_request_context() else 'background'
+    QUERIES.labels(endpoint).inc()
+    if has_request_context() and 'queries' in g:
+        g.queries += 1
+        g.query_time += elapsed
+
+
+def handle_error(context):
+    if context.connection is not None and context.connection.info.get('query_started'):
+        context.connection.info['query_started'].pop()
+
+
+def start_request():
+    g.started = time.perf_counter()
+    g.queries = 0
+    g.query_time = 0.0
+
+    if current_app.config['PROFILE_REQUESTS'] and (
+        request.args.get('__profile') == '1' or request.headers.get('X-Profile') == '1'
+    ):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def finish_request(response):
+    elapsed = time.perf_counter() - g.started
+    endpoint = endpoint_label()
+
+    REQUEST_LATENCY.labels(request.method, endpoint, response.status_code).observe(elapsed)
+    if not response.is_streamed:
+        RESPONSE_SIZE.labels(endpoint).observe(response.calculate_content_length() or 0)
+    REQUEST_QUERIES.labels(endpoint).observe(g.queries)
+    REQUEST_QUERY_TIME.labels(endpoint).observe(g.query_time)
+
+    current_app.logger.info(
+        '%s %s %s %.1fms queries=%d sql=%.1fms',
+        request.method, request.path, response.status_code, elapsed * 1000, g.queries, g.query_time * 1000,
+    )
+
+    if 'profiler' in g:
+        return profile_response(g.pop('profiler'), elapsed)
+    return response
+
+
+def profile_response(profiler, elapsed):
+    """Replace the response with a cProfile breakdown of the request."""
+    profiler.disable()
+    out = io.StringIO()
+    out.write(f"{request.method} {request.full_path} {elapsed * 1000:.1f}ms, "
+              f"{g.queries} queries in {g.query_time * 1000:.1f}ms\n\n")
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_LIMIT)
+    return current_app.response_class(out.getvalue(), mimetype='text/plain')
+
+
+def metrics_view():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return current_app.response_class(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    if not sa.event.contains(sa.engine.Engine, 'before_cursor_execute', before_cursor_execute):
+        sa.event.listen(sa.engine.Engine, 'before_cursor_execute', before_cursor_execute)
+        sa.event.listen(sa.engine.Engine, 'after_cursor_execute', after_cursor_execute)
+        sa.event.listen(sa.engine.Engine, 'handle_error', handle_error)
+
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
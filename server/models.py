@@ -1,11 +1,20 @@
+import hashlib
 from datetime import datetime
 from slugify import slugify
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
 from . import db
 
+# Titles per slug lookup; each adds a LIKE to the OR, keep it under SQLite's expression depth limit
+SLUG_QUERY_CHUNK = 100
+SLUG_RETRIES = 3
+
 product_category = db.Table(
     'product_category',
     db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
-    db.Column('category_id', db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    db.Column('category_id', db.Integer, db.ForeignKey('categories.id'), primary_key=True),
+    # The primary key leads with product_id, category filters look products up by category
+    db.Index('ix_product_category_category_id_product_id', 'category_id', 'product_id')
 )
 
 class Brand(db.Model):
@@ -19,32 +28,127 @@ class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False)
     parent_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
+    # Materialized ancestry, e.g. '/1/7/12/'. Maintained by the mapper events below
+    path = db.Column(db.String(255), index=True)
     parent = db.relationship('Category', remote_side=[id], backref='children')
 
+    @property
+    def ancestor_ids(self):
+        return [int(i) for i in self.path.strip('/').split('/')] if self.path else []
+
     def breadcrumb(self):
-        node = self
-        path = []
-        while node:
-            path.append({'id': node.id, 'name': node.name})
-            node = node.parent
-        return list(reversed(path))
+        if not self.path:
+            node = self
+            path = []
+            while node:
+                path.append({'id': node.id, 'name': node.name})
+                node = node.parent
+            return list(reversed(path))
+
+        ids = self.ancestor_ids
+        names = dict(db.session.execute(
+            db.select(Category.id, Category.name).where(Category.id.in_(ids))
+        ).all())
+        return [{'id': i, 'name': names[i]} for i in ids if i in names]
+
+
+def _category_path(connection, category):
+    if category.parent_id is None and category.parent is None:
+        return f"/{category.id}/"
+    if category.parent is not None and category.parent.path:
+        parent_path = category.parent.path
+    else:
+        parent_id = category.parent.id if category.parent is not None else category.parent_id
+        parent_path = connection.scalar(db.select(Category.path).where(Category.id == parent_id))
+    return f"{parent_path}{category.id}/"
+
+
+@db.event.listens_for(Category, 'after_insert')
+def _set_category_path(mapper, connection, target):
+    path = _category_path(connection, target)
+    connection.execute(db.update(Category.__table__).where(Category.id == target.id).values(path=path))
+    set_committed_value(target, 'path', path)
+
+
+@db.event.listens_for(Category, 'after_update')
+def _move_category_subtree(mapper, connection, target):
+    attrs = db.inspect(target).attrs
+    if not (attrs.parent_id.history.has_changes() or attrs.parent.history.has_changes()):
+        return
+
+    old_path = target.path
+    new_path = _category_path(connection, target)
+    if old_path == new_path:
+        return
+
+    # Rewrite the prefix of the node and every descendant in one statement
+    table = Category.__table__
+    connection.execute(
+        db.update(table)
+        .where(table.c.path.like(f"{old_path}%"))
+        .values(path=db.literal(new_path) + db.func.substr(table.c.path, len(old_path) + 1))
+    )
+    set_committed_value(target, 'path', new_path)
 
 
 class ProductImage(db.Model):
     __tablename__ = "product_images"
 
     id = db.Column(db.Integer, primary_key=True)
-    data = db.Column(db.Text, nullable=False)  # Base64-encoded image data
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False))  # Raw image bytes, only loaded when served
+    content_hash = db.Column(db.String(64), index=True)  # sha256 of data, used as ETag
     mime_type = db.Column(db.String(50), default="image/jpeg")  # For correct browser display
     position = db.Column(db.Integer, default=0)
     product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
 
     product = db.relationship("Product", back_populates="images")
+    variants = db.relationship("ProductImageVariant", cascade="all, delete-orphan", passive_deletes=True)
+
+    @staticmethod
+    def hash_data(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def set_data(self, data):
+        self.data = data
+        self.content_hash = self.hash_data(data)
+
+    @property
+    def url(self):
+        return f"/api/images/{self.id}"
+
+    def variant_url(self, name):
+        # Falls back to the original until the variant has been rendered
+        return f"/api/images/{self.id}/{name}"
+
+
+class ProductImageVariant(db.Model):
+    """Resized WebP rendering of a ProductImage, see server/thumbnails.py."""
+    __tablename__ = "product_image_variants"
+    __table_args__ = (
+        db.UniqueConstraint("image_id", "name"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(db.Integer, db.ForeignKey("product_images.id", ondelete="CASCADE"), nullable=False)
+    name = db.Column(db.String(16), nullable=False)
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    content_hash = db.Column(db.String(64))
+    mime_type = db.Column(db.String(50), nullable=False)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
 
 
 class Product(db.Model):
     __tablename__ = 'products'
-    
+    __table_args__ = (
+        # Keyset pagination seeks for the price and newest sorts
+        db.Index('ix_products_price_id', 'price', 'id'),
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+        # The same within a brand, so brand pages never sort all of the brand's rows
+        db.Index('ix_products_brand_id_price_id', 'brand_id', 'price', 'id'),
+        db.Index('ix_products_brand_id_created_at_id', 'brand_id', 'created_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(256), nullable=False)
     description = db.Column(db.Text)
@@ -53,7 +157,10 @@ class Product(db.Model):
     slug = db.Column(db.String(300), unique=True, index=True)
     brand_id = db.Column(db.Integer, db.ForeignKey('brands.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped by every UPDATE of the row, including bulk ones; the detail ETag is built from it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1', onupdate=db.text('version + 1'))
+
     brand = db.relationship('Brand')
     
     categories = db.relationship(
@@ -70,29 +177,112 @@ class Product(db.Model):
     )
 
     def set_slug(self):
-        base = slugify(self.title)[:200]
-        slug = base
-        i = 1
-        while Product.query.filter_by(slug=slug).first():
-            slug = f"{base}-{i}"
-            i += 1
-        self.slug = slug
-
-    def to_dict(self, include_images=True, include_brand=True, include_categories=True):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'description': self.description,
-            'price': (self.price or 0) / 100.0,
-            'currency': self.currency,
-            'slug': self.slug,
-            'brand': {'id': self.brand.id, 'name': self.brand.name} if (self.brand and include_brand) else None,
-            'images': [
-                {
-                    'src': f"data:{img.mime_type};base64,{img.data}",
-                    'position': img.position
-                }
-                for img in self.images
-            ] if include_images else [],
-            'categories': [{'id': c.id, 'name': c.name} for c in self.categories] if include_categories else []
-        }
+        self.slug = Product.allocate_slugs([self.title])[0]
+
+    def save_with_slug(self):
+        """Add the product with a free slug, retrying when a concurrent insert takes it first."""
+        for attempt in range(SLUG_RETRIES):
+            self.set_slug()
+            try:
+                with db.session.begin_nested():
+                    db.session.add(self)
+                    db.session.flush()
+                return
+            except IntegrityError:
+                if attempt == SLUG_RETRIES - 1:
+                    raise
+
+    @classmethod
+    def suffixed_slugs(cls, base):
+        """Predicate for slugs ``base-...`` that an index can serve.
+
+        Postgres compares with the database collation, which may ignore
+        punctuation, so there a LIKE prefix goes through the text_pattern_ops
+        index. SQLite compares bytes, and a range on ix_products_slug is exact
+        ('.' sorts right after '-'). slugify() output contains no LIKE wildcards.
+        """
+        if db.engine.dialect.name == 'postgresql':
+            return cls.slug.like(f"{base}-%")
+        return db.and_(cls.slug >= f"{base}-", cls.slug < f"{base}.")
+
+    @classmethod
+    def allocate_slugs(cls, titles):
+        """Free slugs for ``titles``, in order, in one query per SLUG_QUERY_CHUNK distinct titles.
+
+        A taken slug gets the suffix after the highest one in use (``-1``, ``-2``, ...),
+        and titles repeated within the batch get consecutive suffixes.
+        """
+        bases = [slugify(title)[:200] for title in titles]
+        distinct = list(dict.fromkeys(bases))
+
+        taken, next_suffix = set(), {}
+        for i in range(0, len(distinct), SLUG_QUERY_CHUNK):
+            chunk = distinct[i:i + SLUG_QUERY_CHUNK]
+            chunk_set = set(chunk)
+            existing = db.session.scalars(db.select(cls.slug).where(db.or_(
+                cls.slug.in_(chunk), *[cls.suffixed_slugs(base) for base in chunk]
+            )))
+            for slug in existing:
+                taken.add(slug)
+                head, _, suffix = slug.rpartition('-')
+                if head in chunk_set and suffix.isdigit():
+                    next_suffix[head] = max(next_suffix.get(head, 1), int(suffix) + 1)
+
+        slugs = []
+        for base in bases:
+            slug = base
+            while slug in taken:
+                n = next_suffix.get(base, 1)
+                next_suffix[base] = n + 1
+                slug = f"{base}-{n}"
+            taken.add(slug)
+            slugs.append(slug)
+        return slugs
+
+    # Keys of to_dict(), clients pick a subset with ?fields= (see server/fields.py)
+    FIELDS = ('id', 'title', 'description', 'price', 'currency', 'slug', 'brand', 'images', 'thumbnail', 'categories')
+    DEFAULT_FIELDS = tuple(f for f in FIELDS if f != 'thumbnail')
+    COLUMN_FIELDS = ('title', 'description', 'price', 'currency', 'slug')
+
+    @classmethod
+    def serializer_options(cls, fields=None):
+        """Loader options that fetch exactly what to_dict(fields) touches, in a fixed number of queries."""
+        fields = cls.DEFAULT_FIELDS if fields is None else fields
+        options = [db.load_only(cls.id, *[getattr(cls, f) for f in cls.COLUMN_FIELDS if f in fields])]
+        if 'brand' in fields:
+            options.append(db.joinedload(cls.brand))
+        if 'images' in fields or 'thumbnail' in fields:
+            options.append(db.selectinload(cls.images).load_only(ProductImage.id, ProductImage.position))
+        if 'categories' in fields:
+            options.append(db.selectinload(cls.categories))
+        return options
+
+    def to_dict(self, fields=None):
+        data = {}
+        for field in self.DEFAULT_FIELDS if fields is None else fields:
+            if field == 'price':
+                data[field] = (self.price or 0) / 100.0
+            elif field == 'brand':
+                data[field] = {'id': self.brand.id, 'name': self.brand.name} if self.brand else None
+            elif field == 'images':
+                data[field] = [
+                    {
+                        'src': img.url,
+                        'thumbnail': img.variant_url('thumb'),
+                        'large': img.variant_url('large'),
+                        'position': img.position
+                    }
+                    for img in self.images
+                ]
+            elif field == 'thumbnail':
+                data[field] = self.images[0].variant_url('thumb') if self.images else None
+            elif field == 'categories':
+                data[field] = [{'id': c.id, 'name': c.name} for c in self.categories]
+            else:
+                data[field] = getattr(self, field)
+        return data
+
+@db.event.listens_for(Product, 'before_update')
+def _touch_product(mapper, connection, target):
+    # Category and image changes alone emit no UPDATE of the row, force one so the version moves
+    target.updated_at = datetime.utcnow()
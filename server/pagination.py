@@ -0,0 +1,49 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+import sqlalchemy as sa
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(sort, values):
+    """Opaque cursor holding the sort name and the sort key of the last row returned."""
+    payload = json.dumps({'s': sort, 'k': [_encode_value(v) for v in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor, sort, size):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = [_decode_value(v) for v in payload['k']]
+    except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError):
+        raise InvalidCursor('malformed cursor')
+
+    if payload.get('s') != sort or len(values) != size:
+        raise InvalidCursor('cursor does not match the requested sort')
+    return values
+
+
+def keyset_filter(columns, values, descending=False):
+    """Rows strictly after ``values`` in ``ORDER BY columns``, as a single row-value comparison."""
+    key = sa.tuple_(*columns)
+    # Bound with each column's type, so the boundary compares exactly like the column
+    after = sa.tuple_(*[sa.literal(v, c.type) for c, v in zip(columns, values)])
+    return key < after if descending else key > after
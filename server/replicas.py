@@ -0,0 +1,201 @@
+"""Connection pool settings and routing of read-only views to read replicas.
+
+Views decorated with @read_replica run their queries on one of the
+DB_REPLICA_URIS, picked round-robin among the ones passing a periodic health
+check. Everything else, including every write, uses the primary.
+
+Replicas lag behind the primary, so reads go back to the primary for
+DB_REPLICA_STICKY_SECONDS after a write: for the writing client through a
+cookie, and for everybody through a marker in the shared cache, so a lagging
+replica cannot refill a just invalidated cache entry with the old data.
+"""
+import itertools
+import logging
+import threading
+import time
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = 'db_primary'
+WRITE_MARKER_KEY = 'db:last_write'
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* settings."""
+    if config['DB_POOL_DISABLED']:
+        # Behind pgbouncer in transaction mode: it pools, every checkout is a fresh connection to it
+        return {'poolclass': NullPool}
+
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING'], 'pool_recycle': config['DB_POOL_RECYCLE']}
+    if not config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+        )
+    return options
+
+
+def replica_binds(config):
+    return {f"replica_{i}": uri for i, uri in enumerate(config['DB_REPLICA_URIS'])}
+
+
+class Replicas:
+    """Round-robin over replica engines, skipping ones that failed a health check."""
+
+    def __init__(self, engines, check_interval=10, retry_interval=30):
+        self.engines = engines
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self._counter = itertools.count()
+        self._checked = {}
+        self._down_until = {}
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def choose(self):
+        for _ in range(len(self.engines)):
+            engine = self.engines[next(self._counter) % len(self.engines)]
+            if self.healthy(engine):
+                return engine
+        return None
+
+    def healthy(self, engine):
+        now = time.monotonic()
+        with self._lock:
+            if self._down_until.get(engine, 0) > now:
+                return False
+            if now - self._checked.get(engine, 0) < self.check_interval:
+                return True
+            self._checked[engine] = now
+
+        try:
+            with engine.connect() as conn:
+                conn.execute(sa.text('SELECT 1'))
+        except sa.exc.SQLAlchemyError as e:
+            self.mark_down(engine, e)
+            return False
+        return True
+
+    def mark_down(self, engine, reason):
+        with self._lock:
+            self._down_until[engine] = time.monotonic() + self.retry_interval
+        logger.warning('read replica %s unavailable, using the primary: %s',
+                       engine.url.render_as_string(hide_password=True), reason)
+
+    def record_write(self, cache, window):
+        self._last_write = time.monotonic()
+        # Delete first so every worker drops its L1 copy of the previous marker
+        cache.delete(WRITE_MARKER_KEY)
+        cache.set(WRITE_MARKER_KEY, time.time(), ttl=window)
+
+    def recently_written(self, cache, window):
+        if time.monotonic() - self._last_write < window:
+            return True
+        written = cache.get(WRITE_MARKER_KEY)
+        return written is not None and time.time() - written < window
+
+
+def _replicas():
+    return current_app.extensions.get('replicas')
+
+
+def _choose_replica():
+    """The replica engine for this request, or None for the primary."""
+    replicas = _replicas()
+    window = current_app.config['DB_REPLICA_STICKY_SECONDS']
+    if request.cookies.get(STICKY_COOKIE) or replicas.recently_written(current_app.cache, window):
+        return None
+    return replicas.choose()
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if (
+            bind is not None or self._flushing or isinstance(clause, sa.sql.dml.UpdateBase)
+            or not has_request_context() or not g.get('db_read_replica')
+            or engine is not self._db.engines.get(None)
+        ):
+            return engine
+
+        # Decided on the first query rather than in the decorator, so cache
+        # hits never pay for the health check or the write marker lookup
+        if 'db_replica' not in g:
+            g.db_replica = _choose_replica()
+        return g.db_replica or engine
+
+
+def read_replica(view):
+    """Run the view's queries on a read replica when replicas are configured."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if _replicas() is not None:
+            g.db_read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def after_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+def do_orm_execute(state):
+    # Bulk INSERT/UPDATE/DELETE statements bypass the flush
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info['wrote'] = True
+
+
+def after_commit(session):
+    if not session.info.pop('wrote', False) or not has_app_context() or _replicas() is None:
+        return
+    _replicas().record_write(current_app.cache, current_app.config['DB_REPLICA_STICKY_SECONDS'])
+    if has_request_context():
+        g.db_wrote = True
+
+
+def after_rollback(session):
+    session.info.pop('wrote', None)
+
+
+def set_sticky_cookie(response):
+    if g.pop('db_wrote', False):
+        response.set_cookie(
+            STICKY_COOKIE, '1', max_age=current_app.config['DB_REPLICA_STICKY_SECONDS'],
+            httponly=True, samesite='Lax',
+        )
+    return response
+
+
+def handle_error(context):
+    replicas = _replicas() if has_app_context() else None
+    if replicas is not None and context.is_disconnect and context.engine in replicas.engines:
+        replicas.mark_down(context.engine, context.original_exception)
+
+
+def init_app(app, db):
+    """Register replica routing; call after db.init_app()."""
+    binds = replica_binds(app.config)
+    if not binds:
+        return
+
+    with app.app_context():
+        engines = [db.engines[key] for key in binds]
+    app.extensions['replicas'] = Replicas(
+        engines, app.config['DB_REPLICA_CHECK_INTERVAL'], app.config['DB_REPLICA_RETRY_INTERVAL'],
+    )
+
+    for engine in engines:
+        sa.event.listen(engine, 'handle_error', handle_error)
+    if not sa.event.contains(Session, 'after_flush', after_flush):
+        sa.event.listen(Session, 'after_flush', after_flush)
+        sa.event.listen(Session, 'do_orm_execute', do_orm_execute)
+        sa.event.listen(Session, 'after_commit', after_commit)
+        sa.event.listen(Session, 'after_rollback', after_rollback)
+    app.after_request(set_sticky_cookie)
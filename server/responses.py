@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import zlib
+
+import orjson
+from flask import current_app, request, stream_with_context
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def brotli_enabled():
+    return brotli is not None and current_app.config['RESPONSE_COMPRESSION_BROTLI']
+
+
+def negotiate_encoding(available):
+    """The first of ``available`` with the highest quality in Accept-Encoding, or None for identity."""
+    accepted = request.accept_encodings
+    # Browsers list gzip first with the same quality as br, so ties go to our order
+    best = max(available, key=lambda encoding: accepted[encoding], default=None)
+    return best if best and accepted[best] else None
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli_enabled() else ('gzip',)
+
+
+def compress(body, encoding):
+    config = current_app.config
+    if encoding == 'br':
+        return brotli.compress(body, quality=config['RESPONSE_BROTLI_QUALITY'])
+    return gzip.compress(body, compresslevel=config['RESPONSE_COMPRESSION_LEVEL'], mtime=0)
+
+
+def render_json(payload, etag=None):
+    """Encode a JSON response body once, so cache hits can send it without re-encoding.
+
+    Bodies over RESPONSE_COMPRESSION_MIN_SIZE are stored gzip-compressed, and
+    also brotli-compressed when brotli is installed. The ETag is ``etag``
+    (e.g. a row version) plus a digest of the body, so it also changes when a
+    release changes the payload, and is cached with the body so revalidation
+    never needs the database.
+    """
+    body = orjson.dumps(payload)
+    digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+    etag = f"{etag}.{digest}" if etag else digest
+    if len(body) < current_app.config['RESPONSE_COMPRESSION_MIN_SIZE']:
+        return {'body': body, 'encoding': None, 'etag': etag}
+    rendered = {'body': compress(body, 'gzip'), 'encoding': 'gzip', 'etag': etag}
+    if brotli_enabled():
+        rendered['br'] = compress(body, 'br')
+    return rendered
+
+
+def set_cache_headers(response):
+    config = current_app.config
+    response.cache_control.public = True
+    response.cache_control.max_age = config['API_CACHE_MAX_AGE']
+    response.cache_control.s_maxage = config['API_CACHE_S_MAXAGE']
+    response.cache_control.stale_while_revalidate = config['API_CACHE_STALE_WHILE_REVALIDATE']
+
+
+def send_rendered(rendered, status=200):
+    """Response for a body from render_json(), in the best encoding the client accepts.
+
+    Answers 304 when If-None-Match has the ETag, and lets shared caches keep
+    the response for API_CACHE_S_MAXAGE seconds, then serve it stale while
+    they revalidate.
+    """
+    body, encoding, etag = rendered['body'], rendered['encoding'], rendered.get('etag')
+    response = current_app.response_class(status=status, mimetype='application/json')
+    set_cache_headers(response)
+
+    if encoding == 'gzip':
+        response.vary.add('Accept-Encoding')
+        # Entries cached without a brotli body only offer gzip
+        chosen = negotiate_encoding(('br', 'gzip') if 'br' in rendered else ('gzip',))
+        if chosen:
+            body = rendered['br'] if chosen == 'br' else body
+            response.headers['Content-Encoding'] = chosen
+            # A strong ETag names exact bytes, every encoding needs its own
+            etag = etag and f"{etag}-{chosen}"
+        else:
+            body = gzip.decompress(body)
+
+    # Entries cached before ETags existed have none until they are refreshed
+    if etag:
+        response.set_etag(etag)
+        if etag in request.if_none_match:
+            response.status_code = 304
+            return response
+
+    response.set_data(body)
+    return response
+
+
+def encode_stream(head, key, items, tail, batch=100):
+    """Encode ``{**head, key: [*items], **tail()}`` a batch of items at a time.
+
+    ``items`` is consumed lazily and ``tail`` is called after the last item,
+    for fields that are only known then, such as a next-page cursor.
+    """
+    opening = orjson.dumps(head)[:-1]
+    yield opening + (b',' if head else b'') + orjson.dumps(key) + b':['
+    chunk, separator = [], b''
+    for item in items:
+        chunk.append(orjson.dumps(item))
+        if len(chunk) == batch:
+            yield separator + b','.join(chunk)
+            chunk, separator = [], b','
+    if chunk:
+        yield separator + b','.join(chunk)
+    closing = orjson.dumps(tail())
+    yield b']' + (b',' + closing[1:] if len(closing) > 2 else b'}')
+
+
+def compress_stream(chunks, encoding, level):
+    """Compress ``chunks`` as they come, flushing after each so clients can decode them right away."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def send_stream(chunks):
+    """Streamed JSON response for the chunks of encode_stream(), compressed on the fly.
+
+    The request context, and with it the database session, stays open until
+    the last chunk is sent. Streamed responses have no ETag and are not kept
+    by shared caches.
+    """
+    encoding = negotiate_encoding(available_encodings())
+    chunks = stream_with_context(chunks)
+    if encoding:
+        # Runs after the request context is gone, so settings are read now
+        config = current_app.config
+        level = config['RESPONSE_BROTLI_QUALITY'] if encoding == 'br' else config['RESPONSE_COMPRESSION_LEVEL']
+        chunks = compress_stream(chunks, encoding, level)
+    response = current_app.response_class(chunks, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    # nginx would otherwise buffer the body before passing it on
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def compress_response(response):
+    """Compress JSON responses not built by render_json(), such as the admin API's."""
+    if (not 200 <= response.status_code < 300 or response.mimetype != 'application/json'
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or 'ETag' in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < current_app.config['RESPONSE_COMPRESSION_MIN_SIZE']:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(available_encodings())
+    if encoding:
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
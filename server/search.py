@@ -0,0 +1,147 @@
+import re
+
+import sqlalchemy as sa
+from sqlalchemy.orm import aliased
+
+from . import db
+from .models import Category, Product, product_category
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Maintained by migrations only: a stored tsvector column on Postgres and an
+# external-content FTS5 table on SQLite. Neither is part of the ORM metadata.
+search_vector = sa.literal_column('products.search_vector')
+products_fts = sa.table('products_fts', sa.column('rowid', sa.Integer))
+
+# Title matches weigh more than description matches in the SQLite ranking.
+# The Postgres column applies the same split with setweight('A'/'B').
+FTS_COLUMN_WEIGHTS = (10.0, 1.0)
+
+_fulltext_available = {}
+
+
+def tokenize(q):
+    return TOKEN_RE.findall((q or '').lower())
+
+
+def fulltext_available(engine=None):
+    """Whether the full-text index migration has been applied to this database."""
+    engine = engine or db.engine
+    key = str(engine.url)
+    if key not in _fulltext_available:
+        inspector = sa.inspect(engine)
+        if engine.dialect.name == 'postgresql':
+            columns = {c['name'] for c in inspector.get_columns('products')}
+            available = 'search_vector' in columns
+        elif engine.dialect.name == 'sqlite':
+            available = inspector.has_table('products_fts')
+        else:
+            available = False
+        _fulltext_available[key] = available
+    return _fulltext_available[key]
+
+
+def apply_text_search(query, q):
+    """Restrict a Product query to rows matching the search text.
+
+    Every token is prefix-matched and all tokens must match. Returns the
+    filtered query and a rank expression where ascending order puts the most
+    relevant products first, or None when the database has no full-text index
+    and the plain ``ilike`` fallback is used.
+    """
+    tokens = tokenize(q)
+    if not tokens:
+        return query, None
+
+    if not fulltext_available():
+        for token in tokens:
+            pattern = f"%{token}%"
+            query = query.filter(sa.or_(Product.title.ilike(pattern), Product.description.ilike(pattern)))
+        return query, None
+
+    if db.engine.dialect.name == 'postgresql':
+        tsquery = sa.func.to_tsquery('english', ' & '.join(f"{t}:*" for t in tokens))
+        query = query.filter(search_vector.op('@@')(tsquery))
+        rank = -sa.func.ts_rank_cd(search_vector, tsquery)
+        return query, rank
+
+    match = ' '.join(f'"{t}"*' for t in tokens)
+    query = query.join(products_fts, products_fts.c.rowid == Product.id).filter(
+        sa.literal_column('products_fts').op('MATCH')(match)
+    )
+    rank = sa.func.bm25(sa.literal_column('products_fts'), *FTS_COLUMN_WEIGHTS)
+    return query, rank
+
+
+def filter_products(q='', category_id=None, brand_id=None, min_price=None, max_price=None):
+    """Product query for a search predicate, plus its relevance rank (see apply_text_search).
+
+    ``min_price`` and ``max_price`` are inclusive bounds in cents.
+    """
+    query = Product.query
+    rank = None
+    if q:
+        query, rank = apply_text_search(query, q)
+    if brand_id:
+        query = query.filter(Product.brand_id == brand_id)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+    if category_id:
+        query = query.filter(Product.id.in_(category_subtree_products(category_id)))
+    return query, rank
+
+
+def category_subtree_products(category_id):
+    """Ids of products in a category or any of its descendants, via the materialized path."""
+    root = aliased(Category)
+    root_path = sa.select(root.path).where(root.id == category_id).scalar_subquery()
+    return (
+        sa.select(product_category.c.product_id)
+        .join(Category, Category.id == product_category.c.category_id)
+        .where(Category.path.like(root_path.concat('%')))
+    )
+
+
+# Every sort key is a (column, Product.id) pair
+SORT_KEY_SIZE = 2
+
+
+# Values of ?sort=, ``-price`` being the descending price sort
+SORTS = ('price', '-price', 'newest', 'relevance')
+
+
+class InvalidSort(ValueError):
+    pass
+
+
+def resolve_sort(sort=None, q=''):
+    """Sort name for a ?sort= value; relevance without a full-text query falls back to newest."""
+    if sort is not None and sort not in SORTS:
+        raise InvalidSort(f"sort must be one of {', '.join(SORTS)}")
+    if sort == 'price':
+        return 'price_asc'
+    if sort == '-price':
+        return 'price_desc'
+    # Same condition under which apply_text_search() returns a rank
+    relevance = tokenize(q) and fulltext_available()
+    return 'relevance' if relevance and sort in (None, 'relevance') else 'newest'
+
+
+def sort_key(sort, rank=None):
+    """Columns that totally order results for ``sort`` and whether they sort descending.
+
+    Every key ends in ``Product.id`` so keyset cursors never skip or repeat rows.
+    Backed by the (price, id) and (created_at, id) indexes, and their
+    (brand_id, ...) counterparts when filtering by brand.
+    """
+    if sort == 'price_asc':
+        return [Product.price, Product.id], False
+    if sort == 'price_desc':
+        return [Product.price, Product.id], True
+    if sort == 'relevance' and rank is not None:
+        # ts_rank_cd() is a float4 while cursors bind Python floats as float8; comparing a
+        # widened float4 with the boundary would skip or repeat rows tied on rank
+        return [sa.cast(rank, sa.Double()), Product.id], False
+    return [Product.created_at, Product.id], True
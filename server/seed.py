@@ -1,64 +1,88 @@
 import os
 import re
 import csv
-import base64
+import time
+import zlib
+import random
+import struct
+import hashlib
+import argparse
+import mimetypes
 import requests
 import kagglehub
+from functools import lru_cache
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from lorem_text import lorem
+from slugify import slugify
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 from . import create_app, db
-from .models import Product, Category, ProductImage, Brand
+from .models import Product, Category, ProductImage, ProductImageVariant, Brand, product_category
+from .thumbnails import variant_rows
 
 
 PRODUCTS_PER_MAIN_CATEGORY = 100
 MAX_WORKERS = 16  # tune based on bandwidth/remote rate limits/DB pool
+BATCH_SIZE = 500
+VARIANT_WORKERS = os.cpu_count() or 1
 
 
-def download_image_as_base64(url):
-    try:
-        headers = {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/115.0 Safari/537.36"
-            ),
-            "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Referer": "https://www.amazon.com/",
-        }
-        resp = requests.get(url, headers=headers, timeout=15)
-        resp.raise_for_status()
-        return base64.b64encode(resp.content).decode("utf-8"), resp.headers.get("Content-Type", "image/jpeg")
-    except Exception as e:
-        return None, None
-
-def get_or_create_category(main_cat_name, sub_cat_name):
-    main_cat = Category.query.filter_by(name=main_cat_name, parent_id=None).first()
-    if not main_cat:
-        main_cat = Category(name=main_cat_name)
-        db.session.add(main_cat)
-        db.session.commit()
+class ImageFetcher:
+    """Downloads images over one pooled, keep-alive session with retries and backoff."""
+
+    headers = {
+        "User-Agent": (
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/115.0 Safari/537.36"
+        ),
+        "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Referer": "https://www.amazon.com/",
+    }
+
+    def __init__(self, pool_size=MAX_WORKERS, retries=3, backoff=0.5, timeout=15):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __call__(self, url):
+        try:
+            resp = self.session.get(url, timeout=self.timeout)
+            resp.raise_for_status()
+            return resp.content, resp.headers.get("Content-Type", "image/jpeg")
+        except Exception:
+            return None, None
+
+
+class LocalImages:
+    """Resolves a CSV image column against files in a local directory, by file name."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self, url):
+        path = os.path.join(self.directory, os.path.basename(urlparse(url).path))
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None, None
+        return data, mimetypes.guess_type(path)[0] or "image/jpeg"
 
-    sub_cat = None
-    if sub_cat_name:
-        sub_cat = Category.query.filter_by(name=sub_cat_name, parent_id=main_cat.id).first()
-        if not sub_cat:
-            sub_cat = Category(name=sub_cat_name, parent=main_cat)
-            db.session.add(sub_cat)
-            db.session.commit()
-
-    return sub_cat or main_cat
-
-def get_or_create_brand_from_name(product_name):
-    brand_name = product_name.split()[0].strip() or "Unknown"
-    brand = Brand.query.filter_by(name=brand_name).first()
-    if not brand:
-        brand = Brand(name=brand_name)
-        db.session.add(brand)
-        db.session.commit()
-    return brand
 
 def parse_price(price_str):
     price_clean = re.sub(r"[^\d.]", "", price_str or "")
@@ -69,30 +93,140 @@ def parse_price(price_str):
     except ValueError:
         return None
 
-def seed():
-    # Download latest version
-    path = kagglehub.dataset_download("lokeshparab/amazon-products-dataset")
-    print("Path to dataset files:", path)
-
-    csv_files = [os.path.join(path, f) for f in os.listdir(path) if f.endswith(".csv")]
-
-    for file_path in csv_files:
-        # 1) Load rows first
-        rows = []
-        with open(file_path, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                rows.append(row)
-
-        # 2) Filter/prepare jobs respecting per-main-category cap
-        main_category_counts = {}
-        jobs = []
-        for row in rows:
+
+class CatalogWriter:
+    """Buffers products in memory and writes them in batches with executemany.
+
+    Brands and categories are resolved against dictionaries loaded once up
+    front, so a product costs no extra round-trips unless it introduces a new
+    brand or category. Slugs are deduplicated against a set of the existing
+    ones, loaded once, so they cost no queries either. Image variants are
+    rendered on ``variant_workers`` threads (0 skips them) and written with
+    their batch.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, variant_workers=VARIANT_WORKERS):
+        self.batch_size = batch_size
+        self.renderer = ThreadPoolExecutor(max_workers=variant_workers) if variant_workers else None
+        self.pending = []
+        self.written = 0
+        self.started = time.perf_counter()
+
+        self.brand_ids = dict(db.session.execute(db.select(Brand.name, Brand.id)).all())
+        self.category_ids = {
+            (parent_id, name): id
+            for id, name, parent_id in db.session.execute(db.select(Category.id, Category.name, Category.parent_id))
+        }
+        self.slugs = set(db.session.scalars(db.select(Product.slug)))
+        self.next_suffix = {}
+
+    @property
+    def rows_per_second(self):
+        return self.written / max(time.perf_counter() - self.started, 1e-9)
+
+    def brand_id(self, product_name):
+        brand_name = (product_name.split() or ["Unknown"])[0].strip() or "Unknown"
+        if brand_name not in self.brand_ids:
+            self.brand_ids[brand_name] = db.session.execute(
+                db.insert(Brand).returning(Brand.id), {"name": brand_name}
+            ).scalar_one()
+        return self.brand_ids[brand_name]
+
+    def category_id(self, main_cat_name, sub_cat_name):
+        category_id = self._category_id(None, main_cat_name)
+        if sub_cat_name:
+            category_id = self._category_id(category_id, sub_cat_name)
+        return category_id
+
+    def _category_id(self, parent_id, name):
+        key = (parent_id, name)
+        if key not in self.category_ids:
+            # Goes through the ORM so the mapper events maintain Category.path
+            category = Category(name=name, parent_id=parent_id)
+            db.session.add(category)
+            db.session.flush()
+            self.category_ids[key] = category.id
+        return self.category_ids[key]
+
+    def slug(self, title):
+        # Same scheme as Product.allocate_slugs: the first free -1, -2, ... suffix
+        base = slugify(title)[:200]
+        slug = base
+        while slug in self.slugs:
+            n = self.next_suffix.get(base, 1)
+            self.next_suffix[base] = n + 1
+            slug = f"{base}-{n}"
+        self.slugs.add(slug)
+        return slug
+
+    def add(self, name, price, main_category, sub_category, image_data, mime_type, description=None):
+        self.pending.append({
+            "product": {
+                "title": name,
+                "description": description or f"{name}. {lorem.paragraph()}",
+                "price": round(price * 100),
+                "slug": self.slug(name),
+                "currency": "INR",
+                "brand_id": self.brand_id(name),
+            },
+            "category_id": self.category_id(main_category, sub_category),
+            "image": {"data": image_data, "mime_type": mime_type},
+        })
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        product_ids = db.session.execute(
+            db.insert(Product).returning(Product.id, sort_by_parameter_order=True),
+            [item["product"] for item in self.pending],
+        ).scalars().all()
+
+        db.session.execute(db.insert(product_category), [
+            {"product_id": product_id, "category_id": item["category_id"]}
+            for product_id, item in zip(product_ids, self.pending)
+        ])
+        image_ids = db.session.execute(
+            db.insert(ProductImage).returning(ProductImage.id, sort_by_parameter_order=True),
+            [
+                {
+                    "product_id": product_id,
+                    "data": item["image"]["data"],
+                    "content_hash": ProductImage.hash_data(item["image"]["data"]),
+                    "mime_type": item["image"]["mime_type"],
+                    "position": 0,
+                }
+                for product_id, item in zip(product_ids, self.pending)
+            ],
+        ).scalars().all()
+        if self.renderer:
+            # Pillow releases the GIL while resizing and encoding
+            rendered = self.renderer.map(variant_rows, image_ids, [item["image"]["data"] for item in self.pending])
+            variants = [row for rows in rendered for row in rows]
+            if variants:
+                db.session.execute(db.insert(ProductImageVariant), variants)
+        db.session.commit()
+
+        self.written += len(self.pending)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        if self.renderer:
+            self.renderer.shutdown()
+
+
+def iter_jobs(file_path, main_category_counts, per_category):
+    """Stream CSV rows worth importing, reserving a slot in their main category."""
+    with open(file_path, newline="", encoding="utf-8") as csvfile:
+        for row in csv.DictReader(csvfile):
             main_cat_name = (row.get("main_category") or "").strip()
             if not main_cat_name:
                 continue
             count = main_category_counts.get(main_cat_name, 0)
-            if count >= PRODUCTS_PER_MAIN_CATEGORY:
+            if count >= per_category:
                 continue
 
             # quick price validation before downloading
@@ -106,61 +240,175 @@ def seed():
 
             # Reserve a slot for this main category; will rollback on failure
             main_category_counts[main_cat_name] = count + 1
-            jobs.append({
+            yield {
                 "main_category": main_cat_name,
                 "sub_category": (row.get("sub_category") or "").strip() or None,
                 "name": (row.get("name") or "").strip(),
                 "price": price,
                 "image": img_url,
-            })
-
-        # 3) Parallelize image downloads only
-        results = []
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_job = {executor.submit(download_image_as_base64, job["image"]): job for job in jobs}
-            for future in tqdm(as_completed(future_to_job), total=len(future_to_job), desc=f"Downloading images for {os.path.basename(file_path)}"):
-                job = future_to_job[future]
-                try:
-                    image_base64, mime_type = future.result()
-                except Exception:
-                    image_base64, mime_type = None, None
-
-                # If download failed, release the reserved count
-                if not image_base64:
-                    main_category_counts[job["main_category"]] -= 1
-                    continue
-
-                results.append((job, image_base64, mime_type or "image/jpeg"))
-
-        # 4) Persist to DB in the main thread/session
-        for job, image_base64, mime_type in tqdm(results, desc=f"Seeding DB for {os.path.basename(file_path)}"):
-            # Resolve category and brand with session-safe calls
-            category = get_or_create_category(job["main_category"], job["sub_category"])
-            brand = get_or_create_brand_from_name(job["name"])
-
-            product = Product(
-                title=job["name"],
-                description=f"{job['name']}. {lorem.paragraph()}",
-                price=int(job["price"] * 100),
-                currency="INR",
-                brand=brand
-            )
-            product.set_slug()
-            product.categories.append(category)
-
-            img = ProductImage(
-                data=image_base64,
-                mime_type=mime_type,
-                position=0
-            )
-            product.images.append(img)
-
-            db.session.add(product)
+            }
 
-        db.session.commit()
 
-if __name__ == "__main__":
+def fetch_images(jobs, fetch, max_workers=MAX_WORKERS):
+    """Fetch images with bounded concurrency, yielding (job, data, mime_type) as they finish."""
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        in_flight = set()
+        for job in jobs:
+            in_flight.add(executor.submit(lambda job: (job, *fetch(job["image"])), job))
+            if len(in_flight) >= max_workers * 4:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in wait(in_flight).done:
+            yield future.result()
+    finally:
+        # Consumers may stop early (--limit), drop downloads nobody will use
+        executor.shutdown(cancel_futures=True)
+
+
+def csv_products(file_path, fetch, per_category, max_workers=MAX_WORKERS):
+    """Products from one CSV file whose image could be fetched."""
+    main_category_counts = {}
+    jobs = iter_jobs(file_path, main_category_counts, per_category)
+    for job, image_data, mime_type in fetch_images(jobs, fetch, max_workers):
+        # If the image is missing, release the reserved count
+        if not image_data:
+            main_category_counts[job["main_category"]] -= 1
+            continue
+        yield job, image_data, mime_type or "image/jpeg"
+
+
+# The one synthetic catalog generator; the benchmarks use it too
+SYNTHETIC_BRANDS = [
+    "Apple", "Samsung", "Sony", "LG", "Philips", "Boat", "Noise", "Lenovo", "HP", "Dell",
+    "Asus", "Redmi", "OnePlus", "Realme", "Bajaj", "Havells", "Prestige", "Puma", "Nike", "Adidas",
+]
+SYNTHETIC_ADJECTIVES = [
+    "wireless", "portable", "smart", "premium", "classic", "compact", "ultra", "slim", "digital", "stainless",
+    "waterproof", "rechargeable", "ergonomic", "foldable", "cotton", "leather", "steel", "bluetooth", "gaming", "organic",
+]
+SYNTHETIC_NOUNS = [
+    "phone", "headphones", "speaker", "laptop", "watch", "charger", "keyboard", "mouse", "monitor", "camera",
+    "kettle", "mixer", "fan", "iron", "shoes", "tshirt", "backpack", "bottle", "lamp", "trimmer",
+]
+SYNTHETIC_FILLER = [
+    "lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do",
+    "eiusmod", "tempor", "incididunt", "labore", "dolore", "magna", "aliqua", "warranty", "durable", "design",
+]
+SYNTHETIC_IMAGE_VARIANTS = 64
+
+
+@lru_cache(maxsize=SYNTHETIC_IMAGE_VARIANTS)
+def synthetic_image(variant, size=128):
+    """Deterministic gradient PNG; products share a small pool of them to keep generation cheap."""
+    r, g, b = hashlib.sha256(str(variant).encode()).digest()[:3]
+    row = bytearray(size * 3)
+    row[0::3] = bytes((r + x) % 256 for x in range(size))
+    row[2::3] = bytes([b]) * size
+    scanlines = []
+    for y in range(size):
+        row[1::3] = bytes([(g + y) % 256]) * size
+        scanlines.append(b"\x00" + row)  # filter type 0 per scanline
+    raw = b"".join(scanlines)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def synthetic_title(rng):
+    """"<brand> <adjective> <noun> <n>", the brand always first."""
+    return (f"{rng.choice(SYNTHETIC_BRANDS)} {rng.choice(SYNTHETIC_ADJECTIVES)} "
+            f"{rng.choice(SYNTHETIC_NOUNS)} {rng.randint(1, 999)}")
+
+
+def synthetic_description(rng, title, words=30):
+    return f"{title}. " + " ".join(rng.choices(SYNTHETIC_FILLER + SYNTHETIC_ADJECTIVES, k=words))
+
+
+def synthetic_products(count, main_categories=10, sub_categories=8, seed=0):
+    """``count`` reproducible products spread over a two-level category tree."""
+    rng = random.Random(seed)
+    for i in range(count):
+        main = i % main_categories
+        name = synthetic_title(rng)
+        job = {
+            "main_category": f"Category {main}",
+            "sub_category": f"Category {main}.{rng.randrange(sub_categories)}",
+            "name": name,
+            "price": rng.randint(100, 500000) / 100.0,
+            "description": synthetic_description(rng, name),
+        }
+        yield job, synthetic_image(i % SYNTHETIC_IMAGE_VARIANTS), "image/png"
+
+
+def iter_products(source, per_category, csv_paths=None, images_dir=None, count=1000, max_workers=MAX_WORKERS):
+    if source == "synthetic":
+        yield from synthetic_products(count)
+        return
+
+    if source == "kaggle":
+        # Download latest version
+        path = kagglehub.dataset_download("lokeshparab/amazon-products-dataset")
+        print("Path to dataset files:", path)
+        csv_paths = [os.path.join(path, f) for f in os.listdir(path) if f.endswith(".csv")]
+
+    fetch = LocalImages(images_dir) if images_dir else ImageFetcher(pool_size=max_workers)
+    for file_path in csv_paths:
+        yield from csv_products(file_path, fetch, per_category, max_workers)
+
+
+def seed(source="kaggle", limit=None, batch_size=BATCH_SIZE, per_category=PRODUCTS_PER_MAIN_CATEGORY,
+         csv_paths=None, images_dir=None, count=1000, max_workers=MAX_WORKERS, variant_workers=VARIANT_WORKERS):
+    writer = CatalogWriter(batch_size=batch_size, variant_workers=variant_workers)
+    total = min(filter(None, (count if source == "synthetic" else None, limit)), default=None)
+    progress = tqdm(desc=f"Seeding from {source}", unit="product", total=total)
+
+    products = iter_products(source, per_category, csv_paths, images_dir, count, max_workers)
+    for job, image_data, mime_type in products:
+        writer.add(job["name"], job["price"], job["main_category"], job["sub_category"],
+                   image_data, mime_type, description=job.get("description"))
+        progress.update()
+        if limit and writer.written + len(writer.pending) >= limit:
+            break
+
+    products.close()
+    progress.close()
+    writer.close()
+    print(f"Wrote {writer.written} products ({writer.rows_per_second:.0f} rows/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the product catalog.")
+    parser.add_argument("--source", choices=("kaggle", "csv", "synthetic"), default="kaggle",
+                        help="kaggle downloads the Amazon products dataset, csv reads local files, "
+                             "synthetic generates --count products with generated images")
+    parser.add_argument("--csv", nargs="+", dest="csv_paths", metavar="PATH", help="CSV files for --source csv")
+    parser.add_argument("--images-dir", help="read images from this directory (matched by file name) "
+                                             "instead of downloading them")
+    parser.add_argument("--count", type=int, default=1000, help="products to generate for --source synthetic")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many products")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="products per INSERT batch and commit")
+    parser.add_argument("--per-category", type=int, default=PRODUCTS_PER_MAIN_CATEGORY,
+                        help="products per main category in each CSV file")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="concurrent image downloads")
+    parser.add_argument("--variant-workers", type=int, default=VARIANT_WORKERS,
+                        help="threads rendering thumbnails, 0 to skip them (see flask image-variants)")
+    args = parser.parse_args()
+
+    if args.source == "csv" and not args.csv_paths:
+        parser.error("--source csv requires --csv")
+
     app = create_app()
     with app.app_context():
-        seed()
+        seed(source=args.source, limit=args.limit, batch_size=args.batch_size, per_category=args.per_category,
+             csv_paths=args.csv_paths, images_dir=args.images_dir, count=args.count, max_workers=args.workers,
+             variant_workers=args.variant_workers)
         print("✅ Seeding complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""Background tasks for work that can follow a write instead of delaying its response.
+
+    @task()
+    def render_image_variants(image_ids):
+        ...
+
+    render_image_variants.delay([1, 2, 3])
+
+TASK_QUEUE picks where jobs run:
+
+- ``local`` (default): a thread pool in the process that enqueued them
+- ``redis``: a Redis list consumed by ``flask worker`` processes
+- ``eager``: inline, in a fresh app context, for tests and scripts
+
+Delivery is at least once, so tasks must be idempotent. A failing job is
+retried with exponential backoff up to TASK_MAX_RETRIES times and then kept
+in ``tasks:dead``. With Redis, a job is moved to a per-worker processing list
+while it runs; when a worker dies mid-job, the next worker to start or check
+in puts the job back on the queue, and a job that completed before its
+worker died is skipped on redelivery.
+"""
+import contextlib
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+import redis
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'tasks:queue'
+DELAYED_KEY = 'tasks:delayed'
+DEAD_KEY = 'tasks:dead'
+PROCESSING_PREFIX = 'tasks:processing:'
+HEARTBEAT_PREFIX = 'tasks:worker:'
+# Ids of the workers that may hold jobs, so orphans are found without SCAN
+WORKERS_KEY = 'tasks:workers'
+DONE_PREFIX = 'tasks:done:'
+DONE_TTL = 24 * 3600
+HEARTBEAT_TTL = 30
+
+_registry = {}
+
+
+class Task:
+    def __init__(self, func, name, max_retries=None):
+        self.func = func
+        self.name = name
+        self.max_retries = max_retries
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """Enqueue a call with JSON-serializable arguments; returns the job id."""
+        return enqueue(self.name, args, kwargs)
+
+
+def task(name=None, max_retries=None):
+    """Register a function as a task, under its dotted path unless ``name`` is given."""
+    def decorator(func):
+        registered = Task(func, name or f"{func.__module__}.{func.__name__}", max_retries)
+        _registry[registered.name] = registered
+        return registered
+    return decorator
+
+
+def new_job(name, args=(), kwargs=None):
+    return {'id': uuid.uuid4().hex, 'task': name, 'args': list(args), 'kwargs': kwargs or {}, 'attempt': 0}
+
+
+def run_job(job):
+    _registry[job['task']](*job['args'], **job['kwargs'])
+
+
+def max_retries(job):
+    configured = _registry[job['task']].max_retries
+    return current_app.config['TASK_MAX_RETRIES'] if configured is None else configured
+
+
+def retry_delay(attempt):
+    """Exponential backoff with jitter, so failed jobs do not retry in lockstep."""
+    config = current_app.config
+    delay = min(config['TASK_RETRY_BACKOFF'] * 2 ** (attempt - 1), config['TASK_RETRY_MAX_DELAY'])
+    return delay * random.uniform(0.5, 1.0)
+
+
+class EagerQueue:
+    def push(self, job):
+        app = current_app._get_current_object()
+        with app.app_context():
+            run_job(job)
+
+
+class LocalQueue:
+    """Runs jobs on a thread pool of the current process; nothing survives a restart."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        # Per process, gunicorn workers must not share a pool forked from the master
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tasks')
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def push(self, job):
+        self.executor().submit(self.run, current_app._get_current_object(), job)
+
+    def run(self, app, job):
+        with app.app_context():
+            while True:
+                try:
+                    run_job(job)
+                    return
+                except Exception:
+                    job['attempt'] += 1
+                    if job['attempt'] > max_retries(job):
+                        logger.exception('task %s (%s) failed, giving up', job['task'], job['id'])
+                        return
+                    logger.warning('task %s (%s) failed, retry %d', job['task'], job['id'], job['attempt'],
+                                   exc_info=True)
+                    time.sleep(retry_delay(job['attempt']))
+
+
+class RedisQueue:
+    def __init__(self, url, timeout, fallback):
+        self.url = url
+        self.client = redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.fallback = fallback
+
+    def push(self, job):
+        try:
+            self.client.lpush(QUEUE_KEY, orjson.dumps(job))
+        except redis.RedisError as e:
+            # Losing the follow-up work would be worse than doing it here
+            logger.warning('cannot enqueue task %s, running it locally: %s', job['task'], e)
+            self.fallback.push(job)
+
+
+class Worker:
+    """Consumes the Redis queue one job at a time; run several for more throughput."""
+
+    def __init__(self, app, url):
+        self.app = app
+        # Blocking pops must outlive the socket timeout
+        self.client = redis.from_url(url, socket_timeout=HEARTBEAT_TTL, socket_connect_timeout=5)
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.processing = PROCESSING_PREFIX + self.id
+        self.stopping = False
+        self._last_heartbeat = 0
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run(self, burst=False):
+        """Process jobs until stopped, or with ``burst`` until the queue is empty."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        processed = 0
+        try:
+            while not self.stopping:
+                self.check_in()
+                raw = self.client.blmove(QUEUE_KEY, self.processing, 1, 'RIGHT', 'LEFT')
+                if raw is not None:
+                    self.process(raw)
+                    processed += 1
+                elif burst and not self.client.zcard(DELAYED_KEY):
+                    break
+        finally:
+            self.client.delete(HEARTBEAT_PREFIX + self.id)
+            # A job left behind by an error is requeued by the next worker that checks in
+            if not self.client.llen(self.processing):
+                self.client.srem(WORKERS_KEY, self.id)
+        return processed
+
+    def check_in(self):
+        self.promote_delayed()
+        if time.monotonic() - self._last_heartbeat < HEARTBEAT_TTL / 3:
+            return
+        self.heartbeat()
+        self.requeue_orphans()
+
+    def heartbeat(self):
+        with self.client.pipeline(transaction=False) as pipe:
+            # Re-added every time, in case a missed heartbeat got this worker requeued
+            pipe.sadd(WORKERS_KEY, self.id)
+            pipe.set(HEARTBEAT_PREFIX + self.id, 1, ex=HEARTBEAT_TTL)
+            pipe.execute()
+        self._last_heartbeat = time.monotonic()
+
+    @contextlib.contextmanager
+    def lease(self):
+        """Keep the heartbeat alive from a side thread while a job runs.
+
+        Otherwise a job longer than HEARTBEAT_TTL, such as a full cache warm,
+        would look orphaned and be requeued while it still runs.
+        """
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(HEARTBEAT_TTL / 3):
+                try:
+                    self.heartbeat()
+                except redis.RedisError as e:
+                    logger.warning('cannot refresh the heartbeat of worker %s: %s', self.id, e)
+
+        thread = threading.Thread(target=beat, name='tasks-heartbeat', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def promote_delayed(self):
+        for raw in self.client.zrangebyscore(DELAYED_KEY, 0, time.time(), start=0, num=100):
+            # Only the worker whose ZREM succeeds moves it, so a job is never queued twice
+            if self.client.zrem(DELAYED_KEY, raw):
+                self.client.lpush(QUEUE_KEY, raw)
+
+    def requeue_orphans(self):
+        for worker_id in self.client.smembers(WORKERS_KEY):
+            worker_id = worker_id.decode()
+            if self.client.exists(HEARTBEAT_PREFIX + worker_id):
+                continue
+            requeued = 0
+            while self.client.lmove(PROCESSING_PREFIX + worker_id, QUEUE_KEY, 'RIGHT', 'LEFT') is not None:
+                requeued += 1
+            self.client.srem(WORKERS_KEY, worker_id)
+            if requeued:
+                logger.warning('requeued the unfinished jobs of worker %s', worker_id)
+
+    def process(self, raw):
+        job = orjson.loads(raw)
+        done_key = DONE_PREFIX + job['id']
+        try:
+            if self.client.exists(done_key):
+                return
+            with self.app.app_context(), self.lease():
+                try:
+                    started = time.perf_counter()
+                    run_job(job)
+                    logger.info('task %s (%s) done in %.1fms', job['task'], job['id'],
+                                (time.perf_counter() - started) * 1000)
+                except Exception:
+                    self.retry(job)
+                    return
+            self.client.set(done_key, 1, ex=DONE_TTL)
+        finally:
+            self.client.lrem(self.processing, 1, raw)
+
+    def retry(self, job):
+        job['attempt'] += 1
+        if job['attempt'] > max_retries(job):
+            logger.exception('task %s (%s) failed, moved to %s', job['task'], job['id'], DEAD_KEY)
+            self.client.lpush(DEAD_KEY, orjson.dumps(job))
+            return
+        delay = retry_delay(job['attempt'])
+        logger.warning('task %s (%s) failed, retry %d in %.1fs', job['task'], job['id'], job['attempt'], delay,
+                       exc_info=True)
+        self.client.zadd(DELAYED_KEY, {orjson.dumps(job): time.time() + delay})
+
+
+def enqueue(name, args=(), kwargs=None):
+    job = new_job(name, args, kwargs)
+    current_app.extensions['tasks'].push(job)
+    return job['id']
+
+
+def init_app(app):
+    mode = app.config['TASK_QUEUE']
+    local = LocalQueue(app.config['TASK_LOCAL_WORKERS'])
+    if mode == 'redis':
+        if not app.config.get('REDIS_URL'):
+            raise RuntimeError('TASK_QUEUE=redis needs REDIS_URL')
+        app.extensions['tasks'] = RedisQueue(app.config['REDIS_URL'], app.config['CACHE_REDIS_TIMEOUT'], local)
+    elif mode == 'eager':
+        app.extensions['tasks'] = EagerQueue()
+    else:
+        app.extensions['tasks'] = local
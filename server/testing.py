@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+
+from . import db
+from .cache import Cache
+from .models import Product
+
+# Upper bound on SQL statements per request with a cold cache. These must not
+# depend on page size: a budget that needs raising is usually an N+1 query.
+QUERY_BUDGETS = {
+    'search': 6,
+    'search_filtered': 6,
+    'detail': 6,
+}
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Collect the SQL statements executed on ``engine`` while the block runs."""
+    engine = engine or db.engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sa.event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        sa.event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    with count_queries(engine) as statements:
+        yield statements
+    if len(statements) > limit:
+        raise AssertionError(
+            f"{len(statements)} queries executed, expected at most {limit}:\n" + '\n'.join(statements)
+        )
+
+
+def endpoint_urls():
+    product = Product.query.order_by(Product.id).first()
+    if product is None:
+        return {}
+    category = product.categories[0] if product.categories else None
+    return {
+        'search': '/api/products/search?limit=48',
+        'search_filtered': f"/api/products/search?limit=48&brand_id={product.brand_id or ''}"
+                           f"&category_id={category.id if category else ''}",
+        'detail': f"/api/products/{product.slug}",
+    }
+
+
+def check_query_budgets(app):
+    """Request every endpoint with caching disabled and compare query counts to QUERY_BUDGETS.
+
+    Returns ``{name: (queries, budget)}``. Needs at least one product in the database.
+    """
+    urls = endpoint_urls()
+    db.session.remove()
+
+    cache, app.cache = app.cache, Cache()
+    try:
+        client = app.test_client()
+        results = {}
+        for name, url in urls.items():
+            with count_queries() as statements:
+                response = client.get(url)
+            if response.status_code != 200:
+                raise AssertionError(f"{url} returned {response.status_code}")
+            results[name] = (len(statements), QUERY_BUDGETS[name])
+        return results
+    finally:
+        app.cache = cache
@@ -0,0 +1,97 @@
+"""Thumbnail and WebP variants of product images, rendered off the request path.
+
+Variants are optional: without Pillow, or for data Pillow cannot decode, none
+are stored and the variant URLs redirect to the original image.
+"""
+import io
+import logging
+
+from . import db
+from .models import ProductImage, ProductImageVariant
+from .tasks import task
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels; images are never upscaled
+VARIANTS = {'thumb': 320, 'large': 1024}
+WEBP_QUALITY = 80
+CHUNK_SIZE = 100
+
+
+def render_variants(data):
+    """[(name, webp bytes, width, height)] for the image ``data``."""
+    if Image is None:
+        return []
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            source = ImageOps.exif_transpose(source)
+            if source.mode not in ('RGB', 'RGBA'):
+                source = source.convert('RGBA' if source.has_transparency_data else 'RGB')
+
+            variants = []
+            for name, size in VARIANTS.items():
+                image = source.copy()
+                image.thumbnail((size, size), Image.Resampling.LANCZOS)
+                buffer = io.BytesIO()
+                image.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+                variants.append((name, buffer.getvalue(), image.width, image.height))
+            return variants
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning('cannot render image variants: %s', e)
+        return []
+
+
+def variant_rows(image_id, data):
+    """Insert parameters for the variants of one image."""
+    return [
+        {
+            'image_id': image_id,
+            'name': name,
+            'data': webp,
+            'content_hash': ProductImage.hash_data(webp),
+            'mime_type': 'image/webp',
+            'width': width,
+            'height': height,
+        }
+        for name, webp, width, height in render_variants(data)
+    ]
+
+
+def generate_variants(image_ids):
+    """Render and store the variants of images that have none yet. Returns the number stored."""
+    stored = 0
+    image_ids = list(image_ids)
+    for i in range(0, len(image_ids), CHUNK_SIZE):
+        chunk = image_ids[i:i + CHUNK_SIZE]
+        done = db.select(ProductImageVariant.image_id).where(ProductImageVariant.image_id.in_(chunk))
+        images = db.session.execute(
+            db.select(ProductImage.id, ProductImage.data)
+            .where(ProductImage.id.in_(chunk), ProductImage.id.not_in(done))
+        ).all()
+
+        rows = [row for image_id, data in images for row in variant_rows(image_id, data)]
+        if rows:
+            db.session.execute(db.insert(ProductImageVariant), rows)
+        db.session.commit()
+        stored += len(rows)
+    return stored
+
+
+@task()
+def render_image_variants(image_ids):
+    generate_variants(image_ids)
+
+
+def schedule_variants(image_ids):
+    """Render variants for newly committed images in the background."""
+    if Image is None:
+        return
+    image_ids = list(image_ids)
+    # One job per chunk, so several workers can share a bulk upload
+    for i in range(0, len(image_ids), CHUNK_SIZE):
+        render_image_variants.delay(image_ids[i:i + CHUNK_SIZE])
@@ -0,0 +1,107 @@
+"""Precompute the responses the first wave of traffic asks for.
+
+After a deploy, a Redis flush or a bulk write (which moves search to a new
+cache generation), these would otherwise all miss at once: the first pages of
+the default listing and of every top-level category and top brand, as the
+product grid requests them, and the detail pages of the newest products.
+"""
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from . import db
+from .cache_keys import FILTERS, PRODUCT_FIELDS, SEARCH, product_key
+from .fields import parse_fields
+from .models import Brand, Category, Product
+
+logger = logging.getLogger(__name__)
+
+
+def warm_searches(pages, brands):
+    """(category_id, brand_id, page) of every search page to precompute."""
+    top_categories = db.session.scalars(
+        db.select(Category.id).where(Category.parent_id.is_(None)).order_by(Category.id)
+    ).all()
+    top_brands = db.session.scalars(
+        db.select(Brand.id).join(Product, Product.brand_id == Brand.id)
+        .group_by(Brand.id).order_by(db.func.count(Product.id).desc()).limit(brands)
+    ).all()
+
+    filters = [(None, None)] + [(c, None) for c in top_categories] + [(None, b) for b in top_brands]
+    return [(category_id, brand_id, page) for category_id, brand_id in filters for page in range(1, pages + 1)]
+
+
+def warm_products(count):
+    # The first products of the default (newest) listing are the ones opened most
+    return db.session.scalars(
+        db.select(Product.slug).order_by(Product.created_at.desc(), Product.id.desc()).limit(count)
+    ).all()
+
+
+def run_jobs(jobs, concurrency):
+    """Compute and store ``('search', (category_id, brand_id, page))`` and ``('product', slug)``
+    entries in parallel; returns how many were stored."""
+    # Imported here, the admin blueprint imports this module
+    from .blueprints.products import PRODUCT_CACHE_TTL, product_entry, search_entry
+
+    app = current_app._get_current_object()
+    config = app.config
+    fields = parse_fields({'fields': config['CACHE_WARM_FIELDS']}, Product.FIELDS, Product.DEFAULT_FIELDS)
+    # Pool threads start from an empty context, without the generations bump() pinned
+    context = contextvars.copy_context()
+
+    def run(job):
+        kind, args = job
+        with app.app_context():
+            cache = app.cache
+            if kind == 'search':
+                category_id, brand_id, page = args
+                key, compute = search_entry(cache, category_id=category_id, brand_id=brand_id, page=page,
+                                            fields=fields)
+                return cache.refresh(key, compute, config['CACHE_TTL']) is not None
+            return cache.refresh(*product_entry(cache, args), PRODUCT_CACHE_TTL) is not None
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='cache-warm') as pool:
+        return sum(pool.map(lambda job: context.copy().run(run, job), jobs))
+
+
+def warm_cache(pages=None, products=None, brands=None, concurrency=None):
+    """Compute and store the hot responses in parallel; returns (entries stored, seconds)."""
+    config = current_app.config
+    pages = config['CACHE_WARM_PAGES'] if pages is None else pages
+    products = config['CACHE_WARM_PRODUCTS'] if products is None else products
+    brands = config['CACHE_WARM_BRANDS'] if brands is None else brands
+    concurrency = concurrency or config['CACHE_WARM_CONCURRENCY']
+
+    jobs = [('search', args) for args in warm_searches(pages, brands)]
+    jobs += [('product', slug) for slug in warm_products(products)]
+
+    started = time.perf_counter()
+    stored = run_jobs(jobs, concurrency)
+    return stored, time.perf_counter() - started
+
+
+def refresh_after_write(slugs=()):
+    """Bring the cache up to date with a bulk write before it returns.
+
+    Cached detail pages of ``slugs`` are recomputed in place, the others only
+    dropped from every L1. Search and facets then move to a new generation
+    that already holds the hot pages (see Cache.bump), so readers never fall
+    back to the database for them.
+    """
+    cache = current_app.cache
+    concurrency = current_app.config['CACHE_WARM_CONCURRENCY']
+    started = time.perf_counter()
+
+    keys = {product_key(slug): slug for slug in slugs}
+    cached = cache.cached(keys)
+    cache.delete_many(key for key in keys if key not in cached)
+    stored = run_jobs([('product', keys[key]) for key in cached], concurrency)
+
+    warmed = []
+    cache.bump(SEARCH, FILTERS, PRODUCT_FIELDS, warm=lambda: warmed.append(warm_cache(products=0)[0]))
+    logger.info('refreshed %d cache entries in %.1fs after a write', stored + sum(warmed),
+                time.perf_counter() - started)
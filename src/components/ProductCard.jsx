@@ -2,10 +2,12 @@ import React from 'react'
 import { Link } from 'react-router-dom'
 
 export default function ProductCard({ product }) {
+  // Small WebP rendition for the grid
   const firstImage =
-    product.images?.length > 0
-      ? product.images[0].src // Already prefixed base64
-      : '/placeholder.png'
+    product.thumbnail ||
+    (product.images?.length > 0
+      ? product.images[0].thumbnail || product.images[0].src
+      : '/placeholder.png')
 
   return (
     <Link
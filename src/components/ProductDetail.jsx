@@ -27,7 +27,7 @@ export default function ProductDetail() {
       <div className='grid grid-cols-1 md:grid-cols-3 gap-6'>
         <div className='md:col-span-2 flex items-center justify-center bg-gray-100 rounded'>
           <img
-            src={p.images?.[0]?.src || '/placeholder.png'}
+            src={p.images?.[0]?.large || p.images?.[0]?.src || '/placeholder.png'}
             alt={p.title}
             className="max-h-[500px] w-auto object-contain"
           />
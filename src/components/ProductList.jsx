@@ -23,6 +23,8 @@ export default function ProductList() {
     const params = new URLSearchParams({
       q: debouncedQ,
       page,
+      // Only what ProductCard renders
+      fields: 'id,slug,title,description,price,currency,thumbnail',
       ...(categoryId ? { category_id: categoryId } : {}),
       ...(brandId ? { brand_id: brandId } : {})
     })
@@ -0,0 +1,71 @@
+import os
+import tempfile
+
+# server.config reads the environment at import time
+_db_dir = tempfile.mkdtemp(prefix='catalog-tests-')
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(_db_dir, 'catalog.db')
+os.environ['REDIS_URL'] = ''
+os.environ['TASK_QUEUE'] = 'eager'
+
+import pytest
+import sqlalchemy as sa
+from flask_migrate import upgrade
+
+from server import create_app, db
+from server.models import Brand, Category, Product, ProductImage
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        # The real migrations, so search has its full-text table
+        upgrade(directory=os.path.join(os.path.dirname(__file__), '..', 'migrations'))
+    return app
+
+
+@pytest.fixture(autouse=True)
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(sa.delete(table))
+        db.session.commit()
+        db.session.remove()
+    if app.cache.local is not None:
+        app.cache.local.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def catalog():
+    """Two brands, a category with a subcategory and a few products linked to them, with an image each."""
+    apple, sony = Brand(name='Apple'), Brand(name='Sony')
+    phones = Category(name='Phones')
+    db.session.add_all([apple, sony, phones])
+    db.session.flush()
+    android = Category(name='Android', parent_id=phones.id)
+    db.session.add(android)
+    db.session.flush()
+
+    products = []
+    for i, (title, brand, category) in enumerate([
+        ('Apple smart phone', apple, phones),
+        ('Sony wireless headphones', sony, None),
+        ('Sony android phone', sony, android),
+    ]):
+        product = Product(title=title, description=f"{title} description", price=1000 * (i + 1), brand=brand)
+        image = ProductImage(mime_type='image/png', position=0)
+        image.set_data(f"image of {title}".encode())
+        product.images.append(image)
+        product.save_with_slug()
+        if category is not None:
+            product.categories = [category]
+        products.append(product)
+    db.session.commit()
+    return {'brands': [apple, sony], 'categories': [phones, android], 'products': products}
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from server.asgi import ThreadPoolWsgiToAsgi
+
+
+def call(asgi_app, method='GET', path='/', body=b'', headers=()):
+    """Run one request through ``asgi_app``; returns (status, headers, body)."""
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'root_path': '', 'query_string': b'',
+        'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+        'headers': [(name.encode(), value.encode()) for name, value in headers],
+    }
+    # Sent in two parts, as servers do for larger bodies
+    messages = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                {'type': 'http.request', 'body': body[3:], 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    start, chunks = sent[0], sent[1:]
+    assert start['type'] == 'http.response.start' and not chunks[-1].get('more_body')
+    return start['status'], dict(start['headers']), b''.join(chunk.get('body', b'') for chunk in chunks)
+
+
+def test_requests_and_responses_are_passed_through(app, catalog):
+    asgi_app = ThreadPoolWsgiToAsgi(app, threads=2)
+
+    status, headers, body = call(
+        asgi_app, 'POST', '/api/products', b'{"title": "Lamp", "price": 3}',
+        headers=[('Content-Type', 'application/json')],
+    )
+    assert status == 201 and b'"slug":"lamp"' in body
+
+    status, headers, body = call(asgi_app, path='/api/products/lamp')
+    assert status == 200
+    assert headers[b'content-type'] == b'application/json'
+    assert int(headers[b'content-length']) == len(body)
+
+    status, _, body = call(asgi_app, path='/api/products/lamp', headers=[('If-None-Match', headers[b'etag'].decode())])
+    assert (status, body) == (304, b'')
+
+
+def test_requests_run_on_the_thread_pool():
+    def slow(environ, start_response):
+        time.sleep(0.2)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [environ['PATH_INFO'].encode()]
+
+    asgi_app = ThreadPoolWsgiToAsgi(slow, threads=4)
+
+    async def four_requests():
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*[loop.run_in_executor(None, call, asgi_app, 'GET', f'/{i}') for i in range(4)])
+
+    started = time.perf_counter()
+    results = asyncio.run(four_requests())
+    assert time.perf_counter() - started < 0.6
+    assert [body for _, _, body in results] == [b'/0', b'/1', b'/2', b'/3']
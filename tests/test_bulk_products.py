@@ -0,0 +1,163 @@
+import json
+
+import pytest
+
+from server import db
+from server.blueprints.admin import BULK_MAX_ITEMS
+from server.models import Product, product_category
+
+
+def version_of(product_id):
+    return db.session.scalar(db.select(Product.version).where(Product.id == product_id))
+
+
+def test_bulk_create_reports_each_item(client, catalog):
+    brand = catalog['brands'][0]
+    response = client.post('/api/products/bulk', json=[
+        {'title': 'Desk lamp', 'price': 12.5, 'brand_id': brand.id},
+        {'price': 3},
+        {'title': 'Chair', 'price': 'nan'},
+        {'title': 'Chair', 'price': '1e400'},
+        {'title': 'Chair', 'price': -1},
+        {'title': 'Chair', 'brand_id': '1'},
+        {'title': 'x' * 257},
+        {'title': 'Chair', 'currency': 'RUPEES-INR'},
+        {'title': 'Desk lamp', 'images': ['not base64!']},
+        'not an object',
+        {'title': 'Desk lamp'},
+    ])
+
+    assert response.status_code == 201
+    body = response.json
+    assert (body['created'], body['errors']) == (2, 9)
+    assert [r['index'] for r in body['results']] == list(range(11))
+    errors = {r['index']: r['error'] for r in body['results'] if 'error' in r}
+    assert errors == {
+        1: 'title required',
+        2: 'price must be a finite number',
+        3: 'price must be a finite number',
+        4: 'price must not be negative',
+        5: 'brand_id must be an integer',
+        6: 'title must be at most 256 characters',
+        7: 'currency must be at most 8 characters',
+        8: 'image 0 is not valid base64',
+        9: 'expected an object',
+    }
+    assert body['results'][0]['slug'] == 'desk-lamp'
+    assert body['results'][10]['slug'] == 'desk-lamp-1'
+    assert db.session.get(Product, body['results'][0]['id']).price == 1250
+
+
+def test_bulk_create_without_valid_items_creates_nothing(client):
+    response = client.post('/api/products/bulk', json=[{'price': 1}])
+
+    assert response.status_code == 200
+    assert response.json['created'] == 0
+    assert db.session.scalar(db.select(db.func.count(Product.id))) == 0
+
+
+def test_bulk_create_accepts_ndjson(client):
+    lines = [json.dumps({'title': 'Lamp'}), '', '{not json', json.dumps({'title': 'Rug', 'price': 40})]
+
+    response = client.post('/api/products/bulk', data='\n'.join(lines) + '\n',
+                           content_type='application/x-ndjson')
+
+    assert response.status_code == 201
+    results = [{k: v for k, v in r.items() if k != 'id'} for r in response.json['results']]
+    assert results == [
+        {'index': 0, 'slug': 'lamp'},
+        {'index': 1, 'error': 'invalid JSON'},
+        {'index': 2, 'slug': 'rug'},
+    ]
+
+
+@pytest.mark.parametrize('method', ['POST', 'PATCH', 'DELETE'])
+def test_bulk_requests_are_limited_in_size(client, method):
+    response = client.open('/api/products/bulk', method=method, json=[{'id': 1}] * (BULK_MAX_ITEMS + 1))
+
+    assert response.status_code == 400
+    assert response.json == {'error': f'at most {BULK_MAX_ITEMS} items per request'}
+
+
+def test_bulk_create_rejects_missing_references(client, catalog):
+    brand, category = catalog['brands'][0], catalog['categories'][0]
+
+    response = client.post('/api/products/bulk', json=[
+        {'title': 'Lamp', 'brand_id': 9999},
+        {'title': 'Lamp', 'category_ids': [category.id, 9998, 9999]},
+        {'title': 'Lamp', 'brand_id': brand.id, 'category_ids': [category.id]},
+    ])
+
+    assert response.json['results'][:2] == [
+        {'index': 0, 'error': 'brand 9999 does not exist'},
+        {'index': 1, 'error': 'categories [9998, 9999] do not exist'},
+    ]
+    created = db.session.get(Product, response.json['results'][2]['id'])
+    assert created.brand_id == brand.id
+    assert [c.id for c in created.categories] == [category.id]
+
+
+def test_bulk_update_reports_each_item(client, catalog):
+    first, second, third = (p.id for p in catalog['products'])
+
+    response = client.patch('/api/products/bulk', json=[
+        {'id': first, 'price': 99},
+        {'id': second, 'brand_id': 9999},
+        {'id': third, 'title': ''},
+        {'id': 9999, 'price': 1},
+        {'price': 1},
+        {'id': first, 'price': 1},
+    ])
+
+    assert response.status_code == 200
+    assert response.json['updated'] == 1
+    assert response.json['results'] == [
+        {'index': 0, 'id': first, 'slug': 'apple-smart-phone'},
+        {'index': 1, 'error': 'brand 9999 does not exist'},
+        {'index': 2, 'error': 'title required'},
+        {'index': 3, 'error': 'product 9999 does not exist'},
+        {'index': 4, 'error': 'id required'},
+        {'index': 5, 'error': f'product {first} appears more than once'},
+    ]
+    assert db.session.get(Product, first).price == 9900
+
+
+def test_bulk_update_of_categories_only_bumps_the_version(client, catalog):
+    product, category = catalog['products'][1], catalog['categories'][1]
+    before = version_of(product.id)
+
+    response = client.patch('/api/products/bulk', json=[{'id': product.id, 'category_ids': [category.id]}])
+
+    assert response.json['updated'] == 1
+    db.session.expire_all()
+    assert version_of(product.id) == before + 1
+    assert [c.id for c in db.session.get(Product, product.id).categories] == [category.id]
+
+
+def test_bulk_update_changes_the_served_detail(client, catalog):
+    product = catalog['products'][0]
+    assert client.get(f'/api/products/{product.slug}').json['price'] == 10.0
+
+    client.patch('/api/products/bulk', json=[{'id': product.id, 'price': 12}])
+
+    assert client.get(f'/api/products/{product.slug}').json['price'] == 12.0
+
+
+def test_bulk_delete_reports_each_item(client, catalog):
+    first, second, _ = (p.id for p in catalog['products'])
+
+    response = client.delete('/api/products/bulk', json=[first, {'id': second}, first, 9999, 'x'])
+
+    assert response.json['deleted'] == 2
+    assert response.json['results'] == [
+        {'index': 0, 'id': first, 'slug': 'apple-smart-phone'},
+        {'index': 1, 'id': second, 'slug': 'sony-wireless-headphones'},
+        {'index': 2, 'error': f'product {first} appears more than once'},
+        {'index': 3, 'error': 'product 9999 does not exist'},
+        {'index': 4, 'error': 'id required'},
+    ]
+    assert db.session.scalars(db.select(Product.id)).all() == [catalog['products'][2].id]
+    assert not db.session.scalar(
+        db.select(db.func.count()).select_from(product_category).where(product_category.c.product_id == first)
+    )
+    assert client.get('/api/products/apple-smart-phone').status_code == 404
@@ -0,0 +1,57 @@
+import pytest
+
+from server.testing import count_queries
+
+
+@pytest.mark.parametrize('url', [
+    '/api/products/search?fields=id,price_in_cents',
+    '/api/products/search?include=secret',
+    '/api/products/apple-smart-phone?fields=title,stock',
+])
+def test_unknown_fields_are_rejected(client, catalog, url):
+    response = client.get(url)
+
+    assert response.status_code == 400
+    assert 'unknown fields' in response.json['error']
+
+
+def test_search_returns_only_the_requested_fields(client, catalog):
+    items = client.get('/api/products/search?fields=title,id').json['items']
+
+    assert items and all(list(item) == ['id', 'title'] for item in items)
+
+
+def test_include_adds_to_the_default_fields(client, catalog):
+    default = client.get('/api/products/search').json['items'][0]
+    included = client.get('/api/products/search?include=thumbnail').json['items'][0]
+
+    assert 'thumbnail' not in default
+    assert set(included) == set(default) | {'thumbnail'}
+    assert set(client.get('/api/products/search?fields=id&include=brand').json['items'][0]) == {'id', 'brand'}
+
+
+def test_detail_returns_only_the_requested_fields(client, catalog):
+    detail = client.get('/api/products/apple-smart-phone?fields=title,price').json
+
+    assert detail == {'title': 'Apple smart phone', 'price': 10.0}
+
+
+def test_sparse_search_loads_only_the_requested_columns(client, catalog):
+    with count_queries() as statements:
+        client.get('/api/products/search?fields=id,title&include_total=0')
+    # The others are the facet counts
+    page = [s for s in statements if 'products.title' in s]
+
+    assert len(page) == 1
+    assert 'products.description' not in page[0] and 'brands' not in page[0]
+    assert not any('product_images' in s for s in statements)
+
+
+def test_thumbnail_loads_images_without_their_data(client, catalog):
+    with count_queries() as statements:
+        items = client.get('/api/products/search?fields=id,thumbnail').json['items']
+    image_queries = [s for s in statements if 'FROM product_images' in s]
+
+    assert all(item['thumbnail'] for item in items)
+    assert len(image_queries) == 1
+    assert 'product_images.data' not in image_queries[0]
@@ -0,0 +1,68 @@
+from server import db
+
+
+def test_detail_answers_304_for_a_matching_etag(client, catalog):
+    url = f"/api/products/{catalog['products'][0].slug}"
+    response = client.get(url)
+    etag = response.headers['ETag']
+
+    revalidated = client.get(url, headers={'If-None-Match': etag})
+
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert revalidated.headers['ETag'] == etag
+    assert client.get(url, headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_compressed_search_has_its_own_etag(client, catalog):
+    # Enough items for the body to be stored compressed
+    for i in range(20):
+        client.post('/api/products', json={'title': f'Phone {i}', 'description': 'a phone ' * 10, 'price': i})
+    url = '/api/products/search?limit=24'
+
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    gzipped = client.get(url, headers={'Accept-Encoding': 'gzip'})
+
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    assert client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzipped.headers['ETag']}) \
+        .status_code == 304
+    # Another encoding means other bytes, so the identity ETag does not match
+    assert client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': plain.headers['ETag']}) \
+        .status_code == 200
+
+
+def test_etags_change_after_an_update(client, catalog):
+    product = catalog['products'][0]
+    detail_url, search_url = f'/api/products/{product.slug}', '/api/products/search'
+    detail_etag = client.get(detail_url).headers['ETag']
+    search_etag = client.get(search_url).headers['ETag']
+
+    client.patch('/api/products/bulk', json=[{'id': product.id, 'price': 55}])
+
+    detail = client.get(detail_url, headers={'If-None-Match': detail_etag})
+    assert detail.status_code == 200
+    assert detail.headers['ETag'] != detail_etag
+    assert detail.json['price'] == 55.0
+    assert client.get(search_url, headers={'If-None-Match': search_etag}).status_code == 200
+
+
+def test_etag_changes_when_only_categories_change(client, catalog):
+    product, category = catalog['products'][1], catalog['categories'][0]
+    url = f'/api/products/{product.slug}'
+    etag = client.get(url).headers['ETag']
+
+    product.categories = [category]
+    db.session.commit()
+    client.application.cache.local.clear()
+
+    assert client.get(url).headers['ETag'] != etag
+
+
+def test_read_endpoints_can_be_kept_by_shared_caches(client, catalog):
+    response = client.get(f"/api/products/{catalog['products'][0].slug}")
+
+    cache_control = response.cache_control
+    assert cache_control.public
+    assert cache_control.s_maxage == client.application.config['API_CACHE_S_MAXAGE']
+    assert 'stale-while-revalidate' in response.headers['Cache-Control']
@@ -0,0 +1,18 @@
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from server.pagination import keyset_filter
+from server.search import search_vector, sort_key
+
+
+def test_relevance_keyset_compares_rank_as_double_precision():
+    tsquery = sa.func.to_tsquery('english', 'phone:*')
+    columns, descending = sort_key('relevance', -sa.func.ts_rank_cd(search_vector, tsquery))
+
+    compiled = keyset_filter(columns, [-0.1, 42], descending).compile(dialect=postgresql.dialect())
+
+    assert str(compiled).startswith('(CAST(-ts_rank_cd(products.search_vector, to_tsquery(')
+    assert 'AS DOUBLE PRECISION), products.id) > (' in str(compiled)
+    rank_bound = compiled.binds['param_1']
+    assert rank_bound.value == -0.1
+    assert isinstance(rank_bound.type, sa.Double)
@@ -0,0 +1,29 @@
+from server import db
+from server.models import Product, ProductImage
+from server.testing import QUERY_BUDGETS, check_query_budgets
+
+
+def test_read_endpoints_stay_within_query_budgets(app, catalog):
+    results = check_query_budgets(app)
+
+    assert set(results) == set(QUERY_BUDGETS)
+    for name, (queries, budget) in results.items():
+        assert queries <= budget, f"{name} ran {queries} queries, budget {budget}"
+
+
+def test_query_counts_do_not_grow_with_the_catalog(app, catalog):
+    before = check_query_budgets(app)
+
+    brand, category = catalog['brands'][0], catalog['categories'][0]
+    for i in range(20):
+        product = Product(title=f"Apple phone {i}", price=500 + i, brand=brand)
+        for position in range(2):
+            image = ProductImage(mime_type='image/png', position=position)
+            image.set_data(f"image {i}.{position}".encode())
+            product.images.append(image)
+        product.save_with_slug()
+        product.categories = [category]
+    db.session.commit()
+
+    # More rows per page must not mean more queries, that would be an N+1
+    assert check_query_budgets(app) == before
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from server import db
+from server.models import SLUG_RETRIES, Product
+
+
+def add_products(*slugs):
+    db.session.add_all(Product(title=slug, slug=slug) for slug in slugs)
+    db.session.commit()
+
+
+def test_taken_slug_gets_the_suffix_after_the_highest_in_use():
+    add_products('lamp', 'lamp-1', 'lamp-7', 'lamp-shade')
+
+    assert Product.allocate_slugs(['Lamp']) == ['lamp-8']
+
+
+def test_free_slug_is_used_as_is():
+    add_products('lamp-3')
+
+    assert Product.allocate_slugs(['Lamp']) == ['lamp']
+
+
+def test_repeated_titles_in_a_batch_get_consecutive_suffixes():
+    add_products('desk')
+
+    assert Product.allocate_slugs(['Desk', 'Chair', 'Desk', 'desk!', 'Chair']) == \
+        ['desk-1', 'chair', 'desk-2', 'desk-3', 'chair-1']
+
+
+def test_suffixed_slugs_matches_only_dash_suffixes():
+    add_products('lamp', 'lamp-1', 'lamp-shade', 'lamp.x', 'lampx', 'lam-1')
+
+    matched = db.session.scalars(db.select(Product.slug).where(Product.suffixed_slugs('lamp'))).all()
+
+    assert sorted(matched) == ['lamp-1', 'lamp-shade']
+
+
+def test_save_with_slug_retries_when_a_concurrent_insert_takes_the_slug(monkeypatch):
+    add_products('chair')
+    allocate = Product.allocate_slugs
+    calls = []
+
+    def stale_then_fresh(titles):
+        calls.append(titles)
+        # The first allocation happened before the other insert committed
+        return ['chair'] if len(calls) == 1 else allocate(titles)
+
+    monkeypatch.setattr(Product, 'allocate_slugs', stale_then_fresh)
+    product = Product(title='Chair')
+    product.save_with_slug()
+    db.session.commit()
+
+    assert len(calls) == 2
+    assert product.slug == 'chair-1'
+    assert db.session.scalar(db.select(db.func.count(Product.id))) == 2
+
+
+def test_save_with_slug_gives_up_after_slug_retries(monkeypatch):
+    add_products('chair')
+    calls = []
+    monkeypatch.setattr(Product, 'allocate_slugs', lambda titles: calls.append(titles) or ['chair'])
+
+    with pytest.raises(IntegrityError):
+        Product(title='Chair').save_with_slug()
+    db.session.rollback()
+
+    assert len(calls) == SLUG_RETRIES
+    assert db.session.scalars(db.select(Product.slug)).all() == ['chair']